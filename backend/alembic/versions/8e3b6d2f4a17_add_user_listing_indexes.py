@@ -0,0 +1,30 @@
+"""Add indexes for keyset pagination of the user listing
+
+Revision ID: 8e3b6d2f4a17
+Revises: 5c1f0e7a9d42
+Create Date: 2026-10-17 10:02:13.540971
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e3b6d2f4a17'
+down_revision: Union[str, None] = '5c1f0e7a9d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_users_is_active_id', 'users', ['is_active', 'id'], unique=False)
+    op.create_index('ix_users_is_google_user_id', 'users', ['is_google_user', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_is_google_user_id', table_name='users')
+    op.drop_index('ix_users_is_active_id', table_name='users')
@@ -0,0 +1,43 @@
+"""Add normalized user_scopes table and backfill it from users.scopes
+
+Revision ID: b47d91c3e5f0
+Revises: 8e3b6d2f4a17
+Create Date: 2026-10-17 10:41:55.204318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b47d91c3e5f0'
+down_revision: Union[str, None] = '8e3b6d2f4a17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    user_scopes = op.create_table('user_scopes',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('scope', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'scope')
+    )
+    op.create_index('ix_user_scopes_scope_user_id', 'user_scopes', ['scope', 'user_id'], unique=False)
+
+    # Backfill from the JSON column
+    users = sa.table('users', sa.column('id', sa.Integer()), sa.column('scopes', sa.JSON()))
+    rows = []
+    for user_id, scopes in op.get_bind().execute(sa.select(users.c.id, users.c.scopes)):
+        rows.extend({'user_id': user_id, 'scope': scope} for scope in set(scopes or []))
+    if rows:
+        op.bulk_insert(user_scopes, rows)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_scopes_scope_user_id', table_name='user_scopes')
+    op.drop_table('user_scopes')
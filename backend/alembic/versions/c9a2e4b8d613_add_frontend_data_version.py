@@ -0,0 +1,29 @@
+"""Add frontend_data_version for optimistic concurrency on /cookies
+
+Revision ID: c9a2e4b8d613
+Revises: b47d91c3e5f0
+Create Date: 2026-10-17 11:20:37.662019
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9a2e4b8d613'
+down_revision: Union[str, None] = 'b47d91c3e5f0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('frontend_data_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('frontend_data_version')
@@ -0,0 +1,52 @@
+"""Move frontend_data out of users into user_frontend_data
+
+Revision ID: d3f7a1c5b920
+Revises: c9a2e4b8d613
+Create Date: 2026-10-17 12:05:48.391227
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3f7a1c5b920'
+down_revision: Union[str, None] = 'c9a2e4b8d613'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('user_frontend_data',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('data', sa.JSON(), nullable=False),
+    sa.Column('version', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    # Copy existing data; users that never stored anything get no row
+    op.execute(
+        "INSERT INTO user_frontend_data (user_id, data, version) "
+        "SELECT id, frontend_data, frontend_data_version FROM users "
+        "WHERE frontend_data IS NOT NULL OR frontend_data_version > 0"
+    )
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('frontend_data_version')
+        batch_op.drop_column('frontend_data')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('frontend_data', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('frontend_data_version', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        "UPDATE users SET "
+        "frontend_data = (SELECT data FROM user_frontend_data WHERE user_frontend_data.user_id = users.id), "
+        "frontend_data_version = COALESCE((SELECT version FROM user_frontend_data WHERE user_frontend_data.user_id = users.id), 0)"
+    )
+    op.drop_table('user_frontend_data')
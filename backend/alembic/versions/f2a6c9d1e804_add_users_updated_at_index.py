@@ -0,0 +1,28 @@
+"""Add users updated_at index
+
+Revision ID: f2a6c9d1e804
+Revises: e5c8b2d4f731
+Create Date: 2026-10-17 16:05:41.208113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a6c9d1e804'
+down_revision: Union[str, None] = 'e5c8b2d4f731'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_users_updated_at', 'users', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_updated_at', table_name='users')
@@ -1,5 +1,8 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from .routes import auth, users, cookies
+from .auth import crypto
+from .auth.auth_handler import require_admin_scope
+from . import database
 
 api_router = APIRouter(prefix="/api/v1") # Add a version prefix
 
@@ -10,4 +13,15 @@ api_router.include_router(cookies.router, prefix="/cookies", tags=["User Fronten
 # Add a simple health check endpoint
 @api_router.get("/health", tags=["Health"])
 async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+# Worker/connection pool stats, for sizing and alerting (admin only: they reveal load and capacity)
+@api_router.get("/health/stats", tags=["Health"], dependencies=[Depends(require_admin_scope)])
+async def health_stats():
+    return {
+        "password_hashing": crypto.password_pool_stats(),
+        "database_pool": {
+            "sync": database.pool_stats(database.engine),
+            "async": database.pool_stats(database.async_engine.sync_engine),
+        },
+    }
@@ -1,17 +1,43 @@
 from datetime import datetime, timedelta, timezone
-from typing import List, Dict, Any, Optional
-from jose import JWTError, jwt
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+from jose import JWTError
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer, SecurityScopes
 import httpx
 
 from ..config import settings
-from .. import models, crud, db_models
-from ..database import get_db
-from sqlalchemy.orm import Session
+from .. import models, crud_async, db_models, metrics
+from ..database import get_async_db
+from ..http_client import get_http_client
+from . import google_oidc, jwt_backend, signing_keys
+from .user_cache import UserStatus, user_status_cache, status_from_user
+from sqlalchemy.ext.asyncio import AsyncSession
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login", auto_error=False) # Relative URL based on api.py prefix
 
+class Principal:
+    """
+    The authenticated caller: validated token claims plus the user row.
+    The row is loaded lazily (at most once) so pure scope checks can be served from the cache.
+    """
+
+    def __init__(self, token_data: models.TokenData, db: AsyncSession, user: db_models.User | None = None):
+        self.token_data = token_data
+        self._db = db
+        self._user = user
+
+    async def get_user(self) -> db_models.User:
+        if self._user is None:
+            user = await crud_async.get_user(self._db, user_id=self.token_data.user_id)
+            if user is None: # Deleted since its status was cached
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="User inactive or not found",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+            self._user = user
+        return self._user
+
 # --- JWT Handling ---
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
@@ -28,40 +54,155 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
          # Provide default empty list if scopes missing
         to_encode["scopes"] = []
 
-    encoded_jwt = jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
+    if signing_keys.is_asymmetric():
+        signing_key = signing_keys.get_active_key()
+        return jwt_backend.encode(to_encode, signing_key.private_key, algorithm=settings.algorithm, headers={"kid": signing_key.kid})
+    encoded_jwt = jwt_backend.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
     return encoded_jwt
 
-def decode_access_token(token: str, db: Session) -> models.TokenData:
+def create_access_token_for_user(user: db_models.User, expires_delta: timedelta | None = None) -> str:
+    return create_access_token(
+        data={
+            "sub": str(user.id), # Ensure sub is string
+            "scopes": user.scopes,
+            "ver": user.token_version or 0, # Revocation epoch at issue time
+        },
+        expires_delta=expires_delta,
+    )
+
+def _verification_key(token: str):
+    if not signing_keys.is_asymmetric():
+        return settings.secret_key
+    signing_key = signing_keys.get_verification_key(jwt_backend.get_unverified_header(token).get("kid") or "")
+    if signing_key is None:
+        raise JWTError("Unknown signing key")
+    return signing_key.public_key
+
+def _decode_token_claims(token: str) -> models.TokenData:
+    """Verifies the JWT signature/expiry and extracts the claims. No DB access."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+        payload = jwt_backend.get_verified_claims(token) # Seen (and verified) recently
+        if payload is None:
+            payload = jwt_backend.decode(token, _verification_key(token), algorithms=[settings.algorithm])
+            jwt_backend.remember_verified_claims(token, payload)
+        elif signing_keys.is_asymmetric():
+            _verification_key(token) # Still reject tokens whose signing key has since been retired
         user_id: str = payload.get("sub")
         scopes: List[str] = payload.get("scopes", []) # Ensure scopes is a list
         if user_id is None:
             raise credentials_exception
-        token_data = models.TokenData(user_id=int(user_id), scopes=scopes)
+        return models.TokenData(user_id=int(user_id), scopes=scopes, token_version=payload.get("ver", 0), exp=payload.get("exp"))
     except JWTError:
         raise credentials_exception
     except ValueError: # Handle case where user_id is not an int
          raise credentials_exception
 
-    # Optional: Check if user still exists and is active (more secure)
-    user = crud.get_user(db, user_id=token_data.user_id)
-    if user is None or not user.is_active:
+async def load_user_status(db: AsyncSession, user_id: int) -> Tuple[Optional[UserStatus], Optional[db_models.User]]:
+    """
+    Active flag and scopes for a user, served from the in-process cache when possible.
+    On a cache miss the loaded row is returned too, so callers can keep it.
+    """
+    cached = user_status_cache.get(user_id)
+    if cached is not None:
+        return cached, None
+    user = await crud_async.get_user(db, user_id=user_id)
+    if user is None:
+        return None, None
+    user_status = status_from_user(user)
+    user_status_cache.set(user_id, user_status)
+    return user_status, user
+
+async def load_user_statuses(db: AsyncSession, user_ids: Iterable[int]) -> Dict[int, Optional[UserStatus]]:
+    """ Batch form of load_user_status: cache hits first, then one query for all the misses. """
+    statuses: Dict[int, Optional[UserStatus]] = {}
+    missing = []
+    for user_id in set(user_ids):
+        statuses[user_id] = user_status_cache.get(user_id)
+        if statuses[user_id] is None:
+            missing.append(user_id)
+    if missing:
+        for row in await crud_async.get_user_status_rows(db, missing):
+            statuses[row.id] = status_from_user(row)
+            user_status_cache.set(row.id, statuses[row.id])
+    return statuses
+
+def check_user_status(token_data: models.TokenData, user_status: Optional[UserStatus]) -> models.TokenData:
+    """ Validates decoded claims against the user's current status. No IO. """
+    # Check if user still exists and is active (more secure)
+    if user_status is None or not user_status.is_active:
          raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User inactive or not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    # Important: Update token scopes with current user scopes from DB
-    # This ensures permission changes take effect immediately upon next token validation
-    token_data.scopes = user.scopes
+    # Reject tokens issued before the last revocation (password change, deactivation, scope change)
+    if token_data.token_version != user_status.token_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if settings.token_validation_mode == "stateless":
+        return token_data # Trust the signed scopes/exp
+    # Important: Update token scopes with current user scopes from DB (or the short-lived cache)
+    # This ensures permission changes take effect upon next token validation
+    token_data.scopes = list(user_status.scopes)
     return token_data
 
+async def resolve_principal(token: str, db: AsyncSession) -> Principal:
+    """
+    Validates the token and wraps it in a Principal. The user row, if a route needs it,
+    is loaded once and reused by everything downstream.
+    """
+    token_data = _decode_token_claims(token)
+    user_status, user = await load_user_status(db, token_data.user_id)
+    # Keep a strong reference to a row loaded here: the session's identity map is weak
+    return Principal(check_user_status(token_data, user_status), db, user=user)
+
+async def decode_access_token(token: str, db: AsyncSession) -> models.TokenData:
+    return (await resolve_principal(token, db)).token_data
+
+async def introspect_tokens(tokens: List[str], db: AsyncSession) -> List[models.IntrospectionResult]:
+    """
+    RFC 7662 introspection of a batch of access tokens. Applies the same checks as
+    decode_access_token, but decodes each distinct token once and loads all the
+    users they reference together.
+    """
+    decoded: Dict[str, Optional[models.TokenData]] = {}
+    for token in tokens:
+        if token not in decoded:
+            try:
+                decoded[token] = _decode_token_claims(token)
+            except HTTPException:
+                decoded[token] = None
+    statuses = await load_user_statuses(db, [token_data.user_id for token_data in decoded.values() if token_data])
+
+    inactive = models.IntrospectionResult(active=False)
+    results: Dict[str, models.IntrospectionResult] = {}
+    for token, token_data in decoded.items():
+        if token_data is None:
+            results[token] = inactive
+            continue
+        try:
+            token_data = check_user_status(token_data, statuses.get(token_data.user_id))
+        except HTTPException:
+            results[token] = inactive
+            continue
+        results[token] = models.IntrospectionResult(
+            active=True,
+            sub=str(token_data.user_id),
+            scope=" ".join(token_data.scopes),
+            scopes=token_data.scopes,
+            exp=token_data.exp,
+            token_type="bearer",
+        )
+    return [results[token] for token in tokens]
+
 
 # --- Google OAuth ---
 
@@ -80,14 +221,15 @@ async def get_google_auth_url(state: Optional[str] = None) -> str:
     if state:
         params["state"] = state
 
-    auth_url = f"https://accounts.google.com/o/oauth2/v2/auth?{httpx.QueryParams(params)}"
+    discovery = await google_oidc.get_discovery_document()
+    auth_url = f"{discovery['authorization_endpoint']}?{httpx.QueryParams(params)}"
     return auth_url
 
 async def exchange_code_for_token(code: str) -> Dict[str, Any]:
     if not settings.google_client_id or not settings.google_client_secret or not settings.google_redirect_uri:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Google OAuth not configured")
 
-    token_url = "https://oauth2.googleapis.com/token"
+    token_url = (await google_oidc.get_discovery_document())["token_endpoint"]
     payload = {
         "code": code,
         "client_id": settings.google_client_id,
@@ -95,43 +237,68 @@ async def exchange_code_for_token(code: str) -> Dict[str, Any]:
         "redirect_uri": settings.google_redirect_uri,
         "grant_type": "authorization_code",
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.post(token_url, data=payload)
-        response.raise_for_status() # Raise exception for non-2xx responses
-        return response.json()
+    with metrics.google_request_seconds.time(endpoint="token"):
+        response = await get_http_client().post(token_url, data=payload)
+    response.raise_for_status() # Raise exception for non-2xx responses
+    return response.json()
 
 async def get_google_user_info(access_token: str) -> Dict[str, Any]:
-    user_info_url = "https://www.googleapis.com/oauth2/v1/userinfo"
+    user_info_url = (await google_oidc.get_discovery_document())["userinfo_endpoint"]
     headers = {"Authorization": f"Bearer {access_token}"}
-    async with httpx.AsyncClient() as client:
-        response = await client.get(user_info_url, headers=headers)
-        response.raise_for_status()
-        return response.json()
+    with metrics.google_request_seconds.time(endpoint="userinfo"):
+        response = await get_http_client().get(user_info_url, headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+async def get_google_identity(token_response: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Email/name of the Google user behind a token response. Taken from the locally
+    verified id_token when present (no extra network call), else from userinfo.
+    """
+    id_token = token_response.get("id_token")
+    if id_token:
+        return await google_oidc.verify_id_token(id_token, access_token=token_response.get("access_token"))
+    return await get_google_user_info(token_response["access_token"])
 
 # --- Dependency for getting current user ---
 
+async def get_current_principal(
+    token: str | None = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal | None:
+    # No SecurityScopes here on purpose: FastAPI caches this dependency once per request,
+    # so every auth dependency in the chain shares a single user lookup.
+    if token is None:
+        return None
+    return await resolve_principal(token, db) # This already checks if user exists/active
+
+async def require_principal(
+    principal: Principal | None = Depends(get_current_principal)
+) -> Principal:
+    """ Like get_current_user, but doesn't load the user row (active flag/scopes come from the cache). """
+    if principal is None:
+         raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
 async def get_current_user(
     security_scopes: SecurityScopes, # FastAPI handles checking WWW-Authenticate header scopes
-    token: str | None = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    principal: Principal | None = Depends(get_current_principal)
 ) -> db_models.User:
-    if token is None:
+    if principal is None:
          raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated",
             headers={"WWW-Authenticate": f'Bearer scope="{security_scopes.scope_str}"'}, # Include required scopes in challenge
         )
 
-    token_data = decode_access_token(token, db) # This already checks if user exists/active
-
-    user = crud.get_user(db, user_id=token_data.user_id)
-    if user is None: # Should be caught by decode_access_token, but double-check
-        raise HTTPException(status_code=404, detail="User not found")
-
     # Check Scopes
     if security_scopes.scopes: # If specific scopes are required by the endpoint
         # Use the scopes from the token data (which were refreshed from DB)
-        token_scopes = set(token_data.scopes)
+        token_scopes = set(principal.token_data.scopes)
         for scope in security_scopes.scopes:
             if scope not in token_scopes:
                 raise HTTPException(
@@ -140,7 +307,7 @@ async def get_current_user(
                     headers={"WWW-Authenticate": f'Bearer scope="{security_scopes.scope_str}"'},
                 )
 
-    return user
+    return await principal.get_user()
 
 async def get_current_active_user(
     current_user: db_models.User = Depends(get_current_user) # Use the base dependency
@@ -160,4 +327,15 @@ async def require_admin_scope(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Admin privileges required.",
         )
-    return current_user
\ No newline at end of file
+    return current_user
+# Dependency for token introspection callers (e.g. the API gateway's service account)
+async def require_introspection_scope(
+    principal: Principal = Depends(require_principal)
+) -> Principal:
+    # Checked against the cached token scopes; the caller's user row is never needed here
+    if not {"introspect", "admin"} & set(principal.token_data.scopes):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions. Requires scope: introspect",
+        )
+    return principal
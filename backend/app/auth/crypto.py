@@ -1,9 +1,170 @@
+import asyncio
+import hashlib
+import os
+import random
+import secrets
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from ..config import settings
+from .. import metrics
+
+def build_context(
+    scheme: str = settings.password_hash_scheme,
+    bcrypt_rounds: int = settings.password_bcrypt_rounds,
+    argon2_time_cost: int = settings.password_argon2_time_cost,
+    argon2_memory_cost_kib: int = settings.password_argon2_memory_cost_kib,
+    argon2_parallelism: int = settings.password_argon2_parallelism,
+) -> CryptContext:
+    """
+    New hashes use `scheme` at the configured cost. Hashes in the other scheme, or at a
+    different cost, still verify but report needs_update so they get upgraded on login.
+    """
+    return CryptContext(
+        schemes=[scheme] + [other for other in ("argon2", "bcrypt") if other != scheme],
+        default=scheme,
+        deprecated="auto", # Everything but the default scheme
+        bcrypt__rounds=bcrypt_rounds,
+        argon2__type="ID",
+        argon2__time_cost=argon2_time_cost,
+        argon2__memory_cost=argon2_memory_cost_kib,
+        argon2__parallelism=argon2_parallelism,
+    )
+
+pwd_context = build_context()
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
\ No newline at end of file
+    return pwd_context.hash(password)
+
+def needs_rehash(hashed_password: str) -> bool:
+    # Cheap: parses the hash's scheme/parameters, no hashing
+    return pwd_context.needs_update(hashed_password)
+
+def is_supported_hash(hashed_password: str) -> bool:
+    """ Whether a hash from elsewhere (e.g. a bulk import) is well-formed and verifiable here. """
+    try:
+        scheme = pwd_context.identify(hashed_password)
+        return scheme is not None and pwd_context.handler(scheme).from_string(hashed_password) is not None
+    except (ValueError, TypeError):
+        return False
+
+def hash_refresh_token(token: str) -> str:
+    # Refresh tokens are 256-bit random values, so a fast hash is enough (no bcrypt)
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def generate_refresh_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+# --- Async API backed by a bounded worker pool ---
+# bcrypt takes ~100-300 ms of CPU; running it on the event loop stalls every other request.
+# Jobs beyond password_hash_max_concurrency wait in an asyncio queue (see password_pool_stats).
+
+_executor: Executor | None = None
+_semaphore: asyncio.Semaphore | None = None
+_queued = 0 # Jobs waiting for a free slot
+_in_flight = 0 # Jobs currently running in the pool
+
+def _pool_size() -> int:
+    return settings.password_hash_workers or os.cpu_count() or 1
+
+def _get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if settings.password_hash_executor == "process":
+            _executor = ProcessPoolExecutor(max_workers=_pool_size())
+        else: # bcrypt releases the GIL, so threads scale across cores too
+            _executor = ThreadPoolExecutor(max_workers=_pool_size(), thread_name_prefix="password-hash")
+    return _executor
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.password_hash_max_concurrency or _pool_size())
+    return _semaphore
+
+async def _run_in_pool(operation: str, func: Callable[..., Any], *args: Any) -> Any:
+    global _queued, _in_flight
+    # Counters are only touched from the event loop thread, so no lock is needed
+    _queued += 1
+    queued_at = time.perf_counter()
+    try:
+        await _get_semaphore().acquire()
+    finally:
+        _queued -= 1
+    started = time.perf_counter()
+    metrics.password_hash_wait_seconds.observe(started - queued_at, operation=operation)
+    _in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), func, *args)
+    finally:
+        metrics.password_hash_seconds.observe(time.perf_counter() - started, operation=operation)
+        _in_flight -= 1
+        _get_semaphore().release()
+
+_verify_seconds: float | None = None # Moving average of pool verify time (queueing included)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    global _verify_seconds
+    started = time.monotonic()
+    try:
+        return await _run_in_pool("verify", verify_password, plain_password, hashed_password)
+    finally:
+        elapsed = time.monotonic() - started
+        _verify_seconds = elapsed if _verify_seconds is None else 0.9 * _verify_seconds + 0.1 * elapsed
+
+def calibrate_verify_time() -> None:
+    """ Times one bcrypt verify (sync; run at startup) so padding is realistic from the first request. """
+    global _verify_seconds
+    if _verify_seconds is None:
+        dummy_hash = get_password_hash(secrets.token_urlsafe(16))
+        started = time.monotonic()
+        verify_password("calibration", dummy_hash)
+        _verify_seconds = time.monotonic() - started
+
+async def pad_failed_verify() -> None:
+    """
+    Waits about as long as a password verify takes, without doing one. Used for logins
+    that fail before bcrypt (unknown email, no password set) so their timing doesn't
+    stand out, at no CPU cost.
+    """
+    await asyncio.sleep((_verify_seconds or 0.0) * random.uniform(0.9, 1.1))
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_pool("hash", get_password_hash, password)
+
+async def hash_passwords_async(passwords: List[str]) -> List[str]:
+    """
+    Hashes many passwords across the pool. Submits at most one job per worker at a time,
+    so a login queued meanwhile waits behind one round of hashes, not the whole batch.
+    """
+    limit = asyncio.Semaphore(_pool_size())
+
+    async def hash_one(password: str) -> str:
+        async with limit:
+            return await hash_password_async(password)
+
+    return list(await asyncio.gather(*(hash_one(password) for password in passwords)))
+
+def password_pool_stats() -> Dict[str, Any]:
+    return {
+        "executor": settings.password_hash_executor,
+        "workers": _pool_size(),
+        "max_concurrency": settings.password_hash_max_concurrency or _pool_size(),
+        "in_flight": _in_flight,
+        "queue_depth": _queued,
+    }
+
+def shutdown_password_pool() -> None:
+    global _executor, _semaphore
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    _semaphore = None
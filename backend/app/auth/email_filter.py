@@ -0,0 +1,159 @@
+"""
+Bloom filter of registered emails, so logins for unknown emails can be rejected
+without a DB lookup or bcrypt work (the response is padded to a typical verify
+time instead, see crypto.pad_failed_verify).
+
+A miss is definitive for this process's view of the users table; the view is
+kept current by:
+- crud adding every created/renamed email as it is written (this worker),
+- pulling rows created (higher id) or updated (updated_at watermark) since the last
+  pull, at most every email_filter_sync_seconds and only when a miss needs it
+  (users created or renamed by other workers),
+- a full rebuild every email_filter_rebuild_seconds, in a background task, which
+  drops emails deleted or renamed away (until then they just cost an ordinary lookup).
+"""
+import asyncio
+import hashlib
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from .. import database, db_models
+
+
+class BloomFilter:
+    """ Fixed-size Bloom filter using double hashing over one blake2b digest. """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2)) # bits
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterable[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+_filter: Optional[BloomFilter] = None
+_max_user_id = 0 # Highest user id loaded into the filter
+_updated_since: Optional[datetime] = None # Latest users.updated_at loaded into the filter (DB clock)
+_synced_at = 0.0
+_built_at = 0.0
+_sync_lock: Optional[asyncio.Lock] = None
+_rebuild_task: Optional[asyncio.Task] = None
+_added_during_rebuild: Optional[List[str]] = None # add() calls the rebuilding snapshot may have missed
+
+# Pulls re-read rows updated this long before the watermark: updated_at is stamped when the
+# UPDATE runs, so a transaction committing late can land behind rows already pulled
+_UPDATE_OVERLAP = timedelta(seconds=60)
+
+def _new_filter(user_count: int) -> BloomFilter:
+    # Leave room to grow until the next rebuild resizes it
+    return BloomFilter(max(settings.email_filter_capacity, 2 * user_count), settings.email_filter_error_rate)
+
+def _install(new_filter: BloomFilter, max_user_id: int, updated_since: Optional[datetime]) -> None:
+    global _filter, _max_user_id, _updated_since, _synced_at, _built_at
+    _filter, _max_user_id, _updated_since = new_filter, max_user_id, updated_since
+    _synced_at = _built_at = time.monotonic()
+
+def _snapshot_queries():
+    User = db_models.User
+    # The watermark is read before the scan, so rows updated during it are pulled again later
+    return (
+        select(func.count(User.id), func.max(User.updated_at)),
+        select(User.id, User.email).execution_options(yield_per=10000),
+    )
+
+def build(db: Session) -> None:
+    """ Builds the filter from the users table (sync; run at startup). """
+    if not settings.email_filter_enabled:
+        return
+    count_query, rows_query = _snapshot_queries()
+    user_count, updated_since = db.execute(count_query).one()
+    new_filter = _new_filter(user_count or 0)
+    max_user_id = 0
+    for user_id, email in db.execute(rows_query):
+        new_filter.add(email)
+        max_user_id = max(max_user_id, user_id)
+    _install(new_filter, max_user_id, updated_since)
+
+async def _rebuild(db: AsyncSession) -> None:
+    global _added_during_rebuild
+    _added_during_rebuild = []
+    try:
+        count_query, rows_query = _snapshot_queries()
+        user_count, updated_since = (await db.execute(count_query)).one()
+        new_filter = _new_filter(user_count or 0)
+        max_user_id = 0
+        async for user_id, email in await db.stream(rows_query):
+            new_filter.add(email)
+            max_user_id = max(max_user_id, user_id)
+        for email in _added_during_rebuild:
+            new_filter.add(email)
+        _install(new_filter, max_user_id, updated_since)
+    finally:
+        _added_during_rebuild = None
+
+async def _rebuild_in_background() -> None:
+    try:
+        async with database.AsyncSessionLocal() as db:
+            await _rebuild(db)
+    except Exception as e: # Keep serving from the current filter; the next miss retries
+        print(f"Warning: Could not rebuild the email filter: {e}")
+
+def _schedule_rebuild() -> None:
+    global _rebuild_task
+    if _rebuild_task is None or _rebuild_task.done():
+        _rebuild_task = asyncio.create_task(_rebuild_in_background())
+
+async def _pull_changed_users(db: AsyncSession) -> None:
+    """ Adds emails of users created or updated (e.g. renamed) since the last pull. """
+    global _max_user_id, _updated_since, _synced_at
+    User = db_models.User
+    updated = User.updated_at >= _updated_since - _UPDATE_OVERLAP if _updated_since else User.updated_at.is_not(None)
+    result = await db.execute(select(User.id, User.email, User.updated_at).where(or_(User.id > _max_user_id, updated)))
+    for user_id, email, updated_at in result:
+        _filter.add(email)
+        _max_user_id = max(_max_user_id, user_id)
+        if updated_at is not None and (_updated_since is None or updated_at > _updated_since):
+            _updated_since = updated_at
+    _synced_at = time.monotonic()
+
+def add(email: str) -> None:
+    if _filter is not None:
+        _filter.add(email)
+    if _added_during_rebuild is not None:
+        _added_during_rebuild.append(email)
+
+async def might_exist(db: AsyncSession, email: str) -> bool:
+    """ False only when no user has this email; True means "look it up". """
+    global _sync_lock
+    if not settings.email_filter_enabled:
+        return True
+    if _filter is not None and email in _filter:
+        return True
+    if _filter is None or time.monotonic() - _built_at >= settings.email_filter_rebuild_seconds:
+        _schedule_rebuild() # Full table scan; never inside the request
+        if _filter is None:
+            return True
+    if _sync_lock is None:
+        _sync_lock = asyncio.Lock()
+    async with _sync_lock: # One catch-up query at a time, however many misses arrive together
+        if time.monotonic() - _synced_at >= settings.email_filter_sync_seconds:
+            await _pull_changed_users(db)
+    return email in _filter
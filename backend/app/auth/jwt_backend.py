@@ -0,0 +1,207 @@
+"""
+Pluggable JWT encode/decode, selected by settings.jwt_backend:
+
+- "jose": python-jose, as originally used everywhere.
+- "pyjwt": PyJWT (optional dependency, `pip install pyjwt`).
+- "hmac": HS256/384/512 computed directly with hmac/hashlib from a key prepared
+  once; asymmetric algorithms fall back to python-jose.
+
+Every backend raises jose's JWTError on failure, so callers handle a single
+exception type. Verified claims are also kept in a small TTL cache keyed by the
+full token, so a token seen again skips signature verification until it expires.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+from calendar import timegm
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from jose import JWTError, jwt as jose_jwt
+from jose.backends.base import Key
+
+from ..cache import TTLCache
+from ..config import settings
+from .. import metrics
+
+_HMAC_DIGESTS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(segment: str) -> bytes:
+    try:
+        return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+    except (binascii.Error, ValueError):
+        raise JWTError("Invalid base64 segment")
+
+def _numeric_dates(claims: Dict[str, Any]) -> Dict[str, Any]:
+    # Like jose/PyJWT, accept datetimes for the registered time claims
+    for claim in ("exp", "iat", "nbf"):
+        if isinstance(claims.get(claim), datetime):
+            claims[claim] = timegm(claims[claim].utctimetuple())
+    return claims
+
+def get_unverified_header(token: str) -> Dict[str, Any]:
+    """ JOSE header of a token, without verifying anything (e.g. to pick a key by kid). """
+    try:
+        header = json.loads(_b64decode(token.split(".", 1)[0]))
+    except ValueError: # Also covers JSONDecodeError
+        raise JWTError("Invalid header")
+    if not isinstance(header, dict):
+        raise JWTError("Invalid header")
+    return header
+
+
+class JoseBackend:
+    name = "jose"
+
+    def encode(self, claims: Dict[str, Any], key: Any, algorithm: str, headers: Optional[Dict[str, Any]] = None) -> str:
+        return jose_jwt.encode(claims, key, algorithm=algorithm, headers=headers)
+
+    def decode(self, token: str, key: Any, algorithms: List[str]) -> Dict[str, Any]:
+        return jose_jwt.decode(token, key, algorithms=algorithms)
+
+
+class PyJWTBackend:
+    name = "pyjwt"
+
+    def __init__(self):
+        import jwt as pyjwt # Optional dependency; only imported when selected
+        self._jwt = pyjwt
+
+    @staticmethod
+    def _key(key: Any) -> Any:
+        # Asymmetric keys come from signing_keys as jose objects wrapping cryptography keys
+        return key.prepared_key if isinstance(key, Key) else key
+
+    def encode(self, claims: Dict[str, Any], key: Any, algorithm: str, headers: Optional[Dict[str, Any]] = None) -> str:
+        return self._jwt.encode(claims, self._key(key), algorithm=algorithm, headers=headers)
+
+    def decode(self, token: str, key: Any, algorithms: List[str]) -> Dict[str, Any]:
+        try:
+            return self._jwt.decode(token, self._key(key), algorithms=algorithms)
+        except self._jwt.PyJWTError as e:
+            raise JWTError(str(e))
+
+
+class HmacBackend:
+    """ Direct HS* implementation; everything else is delegated to python-jose. """
+    name = "hmac"
+
+    def __init__(self):
+        self._fallback = JoseBackend()
+        self._macs: Dict[Tuple[Any, str], "hmac.HMAC"] = {} # (key, alg) -> keyed HMAC, copied per use
+        self._headers: Dict[Tuple[str, Any], str] = {} # (alg, extra headers) -> encoded header segment
+
+    def _mac(self, key: Any, algorithm: str) -> "hmac.HMAC":
+        mac = self._macs.get((key, algorithm))
+        if mac is None:
+            secret = key.encode() if isinstance(key, str) else key
+            mac = self._macs[(key, algorithm)] = hmac.new(secret, digestmod=_HMAC_DIGESTS[algorithm])
+        return mac.copy() # Skips re-deriving the inner/outer padded keys
+
+    def encode(self, claims: Dict[str, Any], key: Any, algorithm: str, headers: Optional[Dict[str, Any]] = None) -> str:
+        if algorithm not in _HMAC_DIGESTS:
+            return self._fallback.encode(claims, key, algorithm, headers)
+        header_key = (algorithm, tuple(sorted(headers.items())) if headers else None)
+        header_segment = self._headers.get(header_key)
+        if header_segment is None:
+            header = {"alg": algorithm, "typ": "JWT", **(headers or {})}
+            header_segment = self._headers[header_key] = _b64encode(json.dumps(header, separators=(",", ":"), sort_keys=True).encode())
+        payload_segment = _b64encode(json.dumps(_numeric_dates(dict(claims)), separators=(",", ":")).encode())
+        signing_input = f"{header_segment}.{payload_segment}"
+        mac = self._mac(key, algorithm)
+        mac.update(signing_input.encode("ascii"))
+        return f"{signing_input}.{_b64encode(mac.digest())}"
+
+    def decode(self, token: str, key: Any, algorithms: List[str]) -> Dict[str, Any]:
+        header = get_unverified_header(token)
+        algorithm = header.get("alg")
+        if algorithm not in algorithms:
+            raise JWTError("The specified alg value is not allowed")
+        if algorithm not in _HMAC_DIGESTS:
+            return self._fallback.decode(token, key, algorithms)
+
+        signing_input, _, signature = token.rpartition(".")
+        if signing_input.count(".") != 1:
+            raise JWTError("Not enough segments")
+        try:
+            signing_input_bytes = signing_input.encode("ascii")
+        except UnicodeEncodeError:
+            raise JWTError("Invalid token")
+        mac = self._mac(key, algorithm)
+        mac.update(signing_input_bytes)
+        if not hmac.compare_digest(mac.digest(), _b64decode(signature)):
+            raise JWTError("Signature verification failed.")
+        try:
+            claims = json.loads(_b64decode(signing_input.split(".", 1)[1]))
+        except ValueError:
+            raise JWTError("Invalid payload string")
+        if not isinstance(claims, dict):
+            raise JWTError("Invalid payload string: must be a json object")
+        _validate_claims(claims)
+        return claims
+
+
+def _validate_claims(claims: Dict[str, Any]) -> None:
+    """ The registered-claim checks python-jose applies by default (no audience configured). """
+    now = timegm(datetime.now(timezone.utc).utctimetuple())
+    for claim in ("exp", "iat", "nbf"):
+        if claim in claims and (isinstance(claims[claim], bool) or not isinstance(claims[claim], (int, float))):
+            raise JWTError(f"{claim} claim must be a number")
+    if "exp" in claims and claims["exp"] < now:
+        raise JWTError("Signature has expired.")
+    if "nbf" in claims and claims["nbf"] > now:
+        raise JWTError("The token is not yet valid (nbf)")
+    if "aud" in claims: # Tokens with an audience are meant for someone else
+        raise JWTError("Invalid audience")
+    if "sub" in claims and not isinstance(claims["sub"], str):
+        raise JWTError("Subject must be a string.")
+
+
+_BACKENDS = {"jose": JoseBackend, "pyjwt": PyJWTBackend, "hmac": HmacBackend}
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None or _backend.name != settings.jwt_backend:
+        _backend = _BACKENDS[settings.jwt_backend]()
+    return _backend
+
+def init_jwt_backend() -> None:
+    """ Creates the configured backend at startup (fails fast if PyJWT is missing) and prepares the HS key. """
+    backend = get_backend()
+    if isinstance(backend, HmacBackend) and settings.algorithm in _HMAC_DIGESTS:
+        backend._mac(settings.secret_key, settings.algorithm)
+
+def encode(claims: Dict[str, Any], key: Any, algorithm: str, headers: Optional[Dict[str, Any]] = None) -> str:
+    with metrics.jwt_seconds.time(operation="encode"):
+        return get_backend().encode(claims, key, algorithm, headers)
+
+def decode(token: str, key: Any, algorithms: List[str]) -> Dict[str, Any]:
+    with metrics.jwt_seconds.time(operation="decode"):
+        return get_backend().decode(token, key, algorithms)
+
+# --- Verified-token cache ---
+
+# Keyed by the full token (signature included), so only byte-identical tokens hit.
+# Entries expire at the token's exp, or after the TTL if that comes first.
+verified_claims_cache = TTLCache(
+    max_size=settings.jwt_verified_cache_max_size,
+    ttl_seconds=settings.jwt_verified_cache_ttl_seconds,
+)
+
+def get_verified_claims(token: str) -> Optional[Dict[str, Any]]:
+    claims = verified_claims_cache.get(token)
+    metrics.jwt_verified_cache.inc(result="miss" if claims is None else "hit")
+    return claims
+
+def remember_verified_claims(token: str, claims: Dict[str, Any]) -> None:
+    ttl = verified_claims_cache.ttl_seconds
+    if "exp" in claims:
+        ttl = min(ttl, claims["exp"] - datetime.now(timezone.utc).timestamp())
+    if ttl > 0:
+        verified_claims_cache.set(token, claims, ttl_seconds=ttl)
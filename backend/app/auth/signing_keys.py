@@ -0,0 +1,194 @@
+"""
+Asymmetric JWT signing keys (RS*/ES* algorithms): a ring of keys identified by
+kid, the public JWKS served at /.well-known/jwks.json, and scheduled rotation.
+
+Private keys are PEM files named <kid>.pem in settings.signing_keys_dir, shared
+by all workers; the file mtime is the key's creation time. A new key is
+generated once the newest is signing_key_rotation_days old, published in the
+JWKS for jwks_max_age_seconds (so downstream caches pick it up) before it signs
+anything, and deleted once no unexpired token can reference it. Deleting a file
+retires that key immediately (within signing_keys_reload_seconds).
+
+HS* algorithms keep using settings.secret_key and publish an empty JWKS.
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwk
+from jose.backends.base import Key
+
+from ..config import settings
+from .. import etag
+
+_EC_CURVES = {"ES256": ec.SECP256R1, "ES384": ec.SECP384R1, "ES512": ec.SECP521R1}
+_MIN_RESCAN_SECONDS = 1.0 # Rate limit for rescans triggered by unknown kids
+
+class SigningKey(NamedTuple):
+    kid: str
+    created_at: float # Unix time
+    private_key: Key # jose key objects, parsed once rather than per token
+    public_key: Key
+    public_jwk: Dict[str, Any]
+
+_keys: Dict[str, SigningKey] = {}
+_active: Optional[SigningKey] = None
+_jwks_document: Tuple[bytes, str] = (b'{"keys":[]}', etag.content_etag(b'{"keys":[]}'))
+_ephemeral: Dict[str, Tuple[bytes, float]] = {} # kid -> (pem, created_at) when no signing_keys_dir
+_next_reload = 0.0
+_last_scan = 0.0
+_lock = threading.Lock()
+
+def is_asymmetric() -> bool:
+    return settings.algorithm[:2] in ("RS", "ES")
+
+def _generate_private_pem() -> bytes:
+    if settings.algorithm.startswith("ES"):
+        private_key = ec.generate_private_key(_EC_CURVES[settings.algorithm]())
+    else:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return private_key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+
+def _load_key(kid: str, pem: bytes, created_at: float) -> SigningKey:
+    private_key = jwk.construct(pem, settings.algorithm)
+    public_key = private_key.public_key()
+    public_jwk = {**public_key.to_dict(), "kid": kid, "use": "sig", "alg": settings.algorithm}
+    return SigningKey(kid, created_at, private_key, public_key, public_jwk)
+
+# --- Key storage (directory shared by workers, or process memory) ---
+
+def _key_path(kid: str) -> str:
+    return os.path.join(settings.signing_keys_dir, f"{kid}.pem")
+
+def _scan() -> Dict[str, float]:
+    """ kid -> creation time of every stored key """
+    if not settings.signing_keys_dir:
+        return {kid: created_at for kid, (_, created_at) in _ephemeral.items()}
+    return {
+        entry.name[:-4]: entry.stat().st_mtime
+        for entry in os.scandir(settings.signing_keys_dir)
+        if entry.is_file() and entry.name.endswith(".pem")
+    }
+
+def _read_pem(kid: str) -> bytes:
+    if not settings.signing_keys_dir:
+        return _ephemeral[kid][0]
+    with open(_key_path(kid), "rb") as f:
+        return f.read()
+
+def _store(kid: str, pem: bytes, now: float) -> None:
+    if not settings.signing_keys_dir:
+        _ephemeral[kid] = (pem, now)
+        return
+    # Write privately under a temp name, then link into place: the link fails if another
+    # worker already created this kid, so concurrent rotations converge on one key.
+    tmp_path = os.path.join(settings.signing_keys_dir, f".{kid}.{os.getpid()}.tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pem)
+        os.link(tmp_path, _key_path(kid))
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(tmp_path)
+
+def _remove(kid: str) -> None:
+    if not settings.signing_keys_dir:
+        _ephemeral.pop(kid, None)
+        return
+    try:
+        os.remove(_key_path(kid))
+    except FileNotFoundError:
+        pass # Already pruned by another worker
+
+# --- Key ring ---
+
+def _new_kid(now: float) -> str:
+    # Named after the start of the rotation period, so workers rotating at the same time pick the same kid
+    rotation = settings.signing_key_rotation_days * 86400
+    period_start = now - now % rotation if rotation > 0 else now
+    return datetime.fromtimestamp(period_start, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+def refresh(force: bool = False) -> None:
+    """ Rescans stored keys (at most every signing_keys_reload_seconds), rotating and pruning as due. """
+    global _keys, _active, _jwks_document, _next_reload, _last_scan
+    if not force and time.monotonic() < _next_reload:
+        return
+    with _lock:
+        if not force and time.monotonic() < _next_reload:
+            return
+        now = time.time()
+        stored = _scan()
+        rotation = settings.signing_key_rotation_days * 86400
+        if not stored or (rotation > 0 and now - max(stored.values()) >= rotation):
+            _store(_new_kid(now), _generate_private_pem(), now)
+            stored = _scan()
+        if rotation > 0:
+            # A key signs until its successor is published for jwks_max_age_seconds, then
+            # must verify tokens for one more access token lifetime
+            retention = rotation + settings.jwks_max_age_seconds + settings.access_token_expire_minutes * 60
+            newest = max(stored, key=stored.get)
+            for kid in [kid for kid, created_at in stored.items() if now - created_at > retention and kid != newest]:
+                _remove(kid)
+                del stored[kid]
+
+        keys = {}
+        for kid, created_at in stored.items():
+            known = _keys.get(kid)
+            if known is not None and known.created_at == created_at:
+                keys[kid] = known
+                continue
+            try:
+                keys[kid] = _load_key(kid, _read_pem(kid), created_at)
+            except Exception as e: # Unreadable or wrong key type; don't take signing down with it
+                print(f"Warning: Could not load signing key '{kid}': {e}")
+        if not keys:
+            raise RuntimeError("No usable JWT signing keys")
+
+        # Sign with the newest key that has been published long enough for downstream caches
+        published = [key for key in keys.values() if now - key.created_at >= settings.jwks_max_age_seconds]
+        _active = max(published, key=lambda key: key.created_at) if published else min(keys.values(), key=lambda key: key.created_at)
+        if keys != _keys: # Key set or a key file changed
+            document = json.dumps(
+                {"keys": [key.public_jwk for key in sorted(keys.values(), key=lambda key: -key.created_at)]},
+                separators=(",", ":"),
+            ).encode()
+            _jwks_document = (document, etag.content_etag(document))
+        _keys = keys
+        _last_scan = time.monotonic()
+        _next_reload = _last_scan + settings.signing_keys_reload_seconds
+
+def init_signing_keys() -> None:
+    """ Loads (or creates) the key ring at startup, so the first login doesn't pay for key generation. """
+    if not is_asymmetric():
+        return
+    if not settings.signing_keys_dir:
+        print("Warning: SIGNING_KEYS_DIR not set; using an in-memory signing key (tokens won't survive restarts or work across workers)")
+    refresh(force=True)
+
+def get_active_key() -> SigningKey:
+    refresh()
+    return _active
+
+def get_verification_key(kid: str) -> Optional[SigningKey]:
+    refresh()
+    key = _keys.get(kid)
+    # Another worker may have just rotated; look once more, but don't let made-up kids force a rescan each
+    if key is None and time.monotonic() - _last_scan >= _MIN_RESCAN_SECONDS:
+        refresh(force=True)
+        key = _keys.get(kid)
+    return key
+
+def get_jwks_document() -> Tuple[bytes, str]:
+    """ Serialized public JWKS and its ETag. """
+    if is_asymmetric():
+        refresh()
+    return _jwks_document
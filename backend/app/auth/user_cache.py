@@ -0,0 +1,39 @@
+from typing import NamedTuple, Tuple
+
+from ..cache import TTLCache
+from ..config import settings
+
+
+class UserStatus(NamedTuple):
+    """The bits of a user row that token validation needs."""
+    is_active: bool
+    scopes: Tuple[str, ...]
+    token_version: int
+
+
+# Keyed by user id. Entries are dropped explicitly by crud on writes and otherwise
+# expire after the TTL, which bounds how stale they can get across worker processes.
+user_status_cache = TTLCache(
+    max_size=settings.user_cache_max_size,
+    ttl_seconds=settings.user_cache_ttl_seconds,
+)
+
+
+# Version stamps for conditional GETs, so a 304 can be answered without touching the DB.
+# Writes in this process update/drop them immediately; the (short) TTL bounds how long
+# another worker may answer 304 for data changed elsewhere.
+profile_etag_cache = TTLCache(max_size=settings.user_cache_max_size, ttl_seconds=settings.etag_cache_ttl_seconds)
+frontend_data_version_cache = TTLCache(max_size=settings.user_cache_max_size, ttl_seconds=settings.etag_cache_ttl_seconds)
+
+
+def status_from_user(user) -> UserStatus:
+    return UserStatus(
+        is_active=bool(user.is_active),
+        scopes=tuple(user.scopes or []),
+        token_version=user.token_version or 0,
+    )
+
+
+def invalidate_user(user_id: int) -> None:
+    user_status_cache.invalidate(user_id)
+    profile_etag_cache.invalidate(user_id)
@@ -0,0 +1,150 @@
+"""
+Streaming NDJSON and CSV for bulk user imports and exports. Imports are parsed
+as request body chunks arrive and exports are serialized chunk by chunk, so
+memory stays bounded by one batch however large the data is.
+"""
+import codecs
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
+
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/jsonl")
+CSV_MEDIA_TYPE = "text/csv"
+MAX_RECORD_CHARS = 64 * 1024 # Longer lines are reported as invalid rather than buffered without bound
+
+# A record is (fields, None), or (None, error) when it couldn't be parsed
+Record = Tuple[Optional[Dict[str, Any]], Optional[str]]
+
+
+class BulkFormatError(ValueError):
+    """ The upload as a whole is unusable (e.g. a CSV header without an email column). """
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    skipping = False # Discarding the rest of an oversized line
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *complete, pending = pending.split("\n")
+        for line in complete:
+            if skipping:
+                skipping = False
+                continue
+            yield line.rstrip("\r")
+        if len(pending) > MAX_RECORD_CHARS:
+            if not skipping:
+                yield pending[:MAX_RECORD_CHARS]
+            pending, skipping = "", True
+    pending += decoder.decode(b"", final=True)
+    if pending and not skipping:
+        yield pending.rstrip("\r")
+
+async def read_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Record]:
+    """ One JSON object per line; blank lines are skipped. """
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        if len(line) >= MAX_RECORD_CHARS:
+            yield None, "Line too long"
+            continue
+        try:
+            fields = json.loads(line)
+        except ValueError:
+            yield None, "Invalid JSON"
+            continue
+        yield (fields, None) if isinstance(fields, dict) else (None, "Expected a JSON object")
+
+async def read_csv(chunks: AsyncIterator[bytes], columns: Tuple[str, ...]) -> AsyncIterator[Record]:
+    """
+    RFC 4180 CSV with a header row naming a subset of `columns` (email required).
+    Empty cells are left out, so the field defaults apply.
+    """
+    header: Optional[List[str]] = None
+    record = ""
+    async for line in _lines(chunks):
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2 and len(record) < MAX_RECORD_CHARS:
+            continue # Inside a quoted field that spans lines
+        values, record = next(csv.reader([record]), []), ""
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            unknown = set(header) - set(columns)
+            if "email" not in header or unknown:
+                raise BulkFormatError(
+                    f"CSV header must include 'email' and only these columns: {', '.join(columns)}"
+                )
+            continue
+        if not any(value.strip() for value in values):
+            continue
+        if len(values) != len(header):
+            yield None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield {name: value for name, value in zip(header, values) if value != ""}, None
+    if header is None:
+        raise BulkFormatError("CSV upload is empty")
+
+
+# --- Writers (exports) ---
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def ndjson_lines(columns: Sequence[str], rows: Iterable[Sequence[Any]]) -> bytes:
+    """ Row tuples as NDJSON objects keyed by column name, without building models. """
+    dumps = json.JSONEncoder(default=_json_default, separators=(",", ":")).encode
+    return "".join(dumps(dict(zip(columns, row))) + "\n" for row in rows).encode()
+
+def csv_lines(rows: Iterable[Sequence[Any]], header: Optional[Sequence[str]] = None) -> bytes:
+    """ Row tuples as CSV. Lists are written space-separated, as the importer reads them. """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+    if header:
+        writer.writerow(header)
+    writer.writerows(
+        [" ".join(value) if isinstance(value, list) else value.isoformat() if isinstance(value, datetime) else value for value in row]
+        for row in rows
+    )
+    return buffer.getvalue().encode()
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() in ("gzip", "x-gzip"):
+            return params.replace(" ", "").lower() not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """ Compresses a stream as one gzip member, flushing per chunk so the client sees steady progress. """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # wbits 31: gzip header and trailer
+    async for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+async def gunzip_chunks(chunks: AsyncIterator[bytes], max_chunk: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """ Decompresses a gzip body as it streams in, max_chunk bytes at a time so a small upload can't inflate in memory. """
+    decompressor = zlib.decompressobj(31)
+    in_member = False # Fed bytes of a member whose trailer hasn't been read yet
+    try:
+        async for data in chunks:
+            in_member = in_member or bool(data)
+            while in_member:
+                out = decompressor.decompress(data, max_chunk)
+                if out:
+                    yield out
+                if decompressor.eof: # Concatenated members are one stream (RFC 1952)
+                    data, in_member = decompressor.unused_data, bool(decompressor.unused_data)
+                    decompressor = zlib.decompressobj(31)
+                    continue
+                data = decompressor.unconsumed_tail
+                if not data and not out:
+                    break # Needs more input
+    except zlib.error:
+        raise BulkFormatError("Invalid gzip body")
+    if in_member:
+        raise BulkFormatError("Truncated gzip body")
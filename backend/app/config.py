@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 import os
+from typing import Literal
 from dotenv import load_dotenv
 
 # Load .env file
@@ -10,19 +11,132 @@ class Settings(BaseSettings):
     
     # Backend
     database_url: str = "sqlite:///./auth_service.db"
+    # URL for the async engine. Defaults to database_url with an async driver
+    # (sqlite+aiosqlite / postgresql+asyncpg).
+    async_database_url: str | None = None
     secret_key: str = "default_secret_key" # Provide a default or ensure .env is loaded
-    algorithm: str = "HS256"
+    algorithm: str = "HS256" # HS256 signs with secret_key; RS256/ES256 use the rotating key ring below
+    # Asymmetric signing keys: PEM files named <kid>.pem, shared by all workers. The public
+    # halves are served at /.well-known/jwks.json so other services can verify tokens locally.
+    signing_keys_dir: str | None = None # Unset: one in-memory key per process (development only)
+    signing_key_rotation_days: float = 30.0 # Generate a new key when the newest is this old; 0 disables
+    jwks_max_age_seconds: int = 3600 # JWKS Cache-Control max-age; new keys are published this long before use
+    signing_keys_reload_seconds: float = 60.0 # How often the key directory is rescanned
     access_token_expire_minutes: int = 30
+    # JWT implementation: "hmac" signs/verifies HS* directly with hmac/hashlib (asymmetric
+    # algorithms fall back to python-jose); "pyjwt" needs the optional PyJWT package.
+    jwt_backend: Literal["jose", "pyjwt", "hmac"] = "hmac"
+    # Recently verified tokens skip signature verification until exp, or this TTL if sooner
+    jwt_verified_cache_ttl_seconds: float = 300.0
+    jwt_verified_cache_max_size: int = 10000
+    # Both modes reject tokens whose "ver" claim is older than the user's token version,
+    # which is bumped on scope/active/password changes.
+    # "database": scopes/active flag are re-read (via the user cache) on every validation.
+    # "stateless": the signed scopes/exp claims are trusted and only the version is checked.
+    token_validation_mode: Literal["database", "stateless"] = "database"
     admin_email: str = "admin@example.com"
     admin_password: str = "password"
     backend_host: str = "0.0.0.0"
     backend_port: int = 8000
-    
+
+    # Database connection pool (ignored for in-memory SQLite)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: float = 30.0
+    db_pool_pre_ping: bool = True # Detect connections dropped by the server before using them
+    db_pool_recycle_seconds: int = 1800 # Reconnect after this age; -1 disables
+
+    # SQLite tuning, applied as PRAGMAs on every new connection
+    sqlite_journal_mode: Literal["WAL", "DELETE", "TRUNCATE", "PERSIST", "MEMORY", "OFF"] = "WAL"
+    sqlite_synchronous: Literal["OFF", "NORMAL", "FULL", "EXTRA"] = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size_bytes: int = 256 * 1024 * 1024
+    sqlite_cache_size_kib: int = 64 * 1024
+
+    # Refresh tokens (rotated on every use; delivered as an HttpOnly cookie)
+    refresh_token_expire_days: int = 30
+    refresh_cookie_name: str = "refresh_token"
+    refresh_cookie_path: str = "/api/v1/auth" # Only sent to the auth endpoints
+    refresh_cookie_secure: bool = True
+    refresh_cookie_samesite: Literal["lax", "strict", "none"] = "strict"
+    refresh_token_in_body: bool = False # Also return it in JSON bodies (for non-browser clients)
+    # Expired refresh tokens, and revoked ones older than the retention (kept so reuse of a rotated
+    # token is still detected), are deleted in the background at most this often, triggered by rotations
+    refresh_token_prune_interval_seconds: float = 3600.0 # 0 disables pruning
+    refresh_token_revoked_retention_days: int = 7
+    refresh_token_prune_batch_size: int = 5000
+
+    # Rate limiting (token buckets; "<count>/<seconds|second|minute|hour>", empty disables)
+    rate_limit_enabled: bool = True
+    rate_limit_store: str = "memory" # Or "package.module:ClassName" of a shared RateLimitStore
+    rate_limit_max_keys: int = 100000 # Memory store: least recently used keys beyond this are dropped
+    rate_limit_trusted_proxies: int = 0 # Proxies in front of the app that append to X-Forwarded-For; 0 ignores the header
+    rate_limit_login_per_ip: str = "30/minute"
+    rate_limit_login_per_email: str = "10/minute"
+    rate_limit_refresh_per_ip: str = "60/minute"
+    rate_limit_google_per_ip: str = "30/minute"
+    # Failed-login lockout: this many failures for one email within the window blocks it until they age out
+    login_lockout_max_failures: int = 10
+    login_lockout_window_seconds: float = 900.0
+
+    # Known-email Bloom filter: logins for unknown emails skip the DB lookup and bcrypt
+    email_filter_enabled: bool = True
+    email_filter_capacity: int = 100000 # Minimum size; rebuilds size it for twice the user count
+    email_filter_error_rate: float = 0.01
+    email_filter_sync_seconds: float = 5.0 # How stale the view of users created by other workers may get
+    email_filter_rebuild_seconds: float = 3600.0 # Full rebuild (renames/deletes made by other workers)
+
+    # Prometheus metrics at /metrics (per worker; scrape each one, or put them behind one exporter)
+    metrics_enabled: bool = True
+    # Who may scrape it; with neither set, /metrics is not served (it reveals routes and login failure counts)
+    metrics_bearer_token: str = "" # Scrapers send "Authorization: Bearer <token>"
+    metrics_allowed_ips: list[str] = [] # Or connect from these addresses/networks, e.g. ["10.0.0.0/8"] (see rate_limit_trusted_proxies)
+
+    # Caching
+    # How long (seconds) a user's active flag and scopes may be served from memory during
+    # token validation. Writes through crud invalidate immediately; the TTL bounds staleness
+    # across worker processes. Set either value to 0 to disable the cache.
+    user_cache_ttl_seconds: float = 30.0
+    user_cache_max_size: int = 10000
+    # Version stamps used to answer If-None-Match with 304 without a DB read
+    etag_cache_ttl_seconds: float = 10.0
+
+    # Bulk user import (POST /users/import)
+    user_import_batch_size: int = 1000 # Rows per duplicate check, hashing round trip and insert transaction
+    # Bulk user export (GET /users/export): rows per keyset query. Each query is its own
+    # short transaction, and its connection goes back to the pool before the rows are sent.
+    user_export_chunk_size: int = 5000
+
+    # Password hashing
+    # New hashes use this scheme/cost; older hashes are upgraded in the background on login.
+    # See benchmarks/password_cost.py for picking a cost that fits a target login latency.
+    password_hash_scheme: Literal["bcrypt", "argon2"] = "bcrypt" # argon2 (argon2id) needs argon2-cffi
+    password_bcrypt_rounds: int = 12
+    password_argon2_time_cost: int = 3
+    password_argon2_memory_cost_kib: int = 64 * 1024
+    password_argon2_parallelism: int = 4
+    # Hashing runs in a worker pool so it doesn't block the event loop.
+    password_hash_executor: Literal["thread", "process"] = "thread"
+    password_hash_workers: int | None = None # Defaults to the number of CPUs
+    password_hash_max_concurrency: int | None = None # Jobs allowed in the pool at once; defaults to workers
 
     # Google OAuth
     google_client_id: str | None = None
     google_client_secret: str | None = None
     google_redirect_uri: str | None = None
+    # OpenID discovery document; point it at a local stub in tests
+    google_discovery_url: str = "https://accounts.google.com/.well-known/openid-configuration"
+    google_discovery_cache_ttl_seconds: float = 3600.0
+    google_jwks_cache_ttl_seconds: float = 3600.0
+    google_jwks_min_refresh_seconds: float = 60.0 # Rate limit for refresh-on-unknown-kid
+
+    # Outbound HTTP (shared client used for Google calls)
+    http_client_http2: bool = True # Requires the 'h2' package
+    http_client_max_connections: int = 100
+    http_client_max_keepalive_connections: int = 20
+    http_client_keepalive_expiry_seconds: float = 30.0
+    http_client_timeout_seconds: float = 10.0
+    http_client_connect_timeout_seconds: float = 5.0
 
     # Security
     # List of allowed origins (e.g., "http://localhost:5173", "https://myapp.com")
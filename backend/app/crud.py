@@ -1,23 +1,51 @@
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from . import db_models, models
-from .auth import crypto
+from .auth import crypto, email_filter, user_cache
 from typing import List, Optional
+from datetime import datetime, timezone
 
 # --- User CRUD ---
 
 def get_user(db: Session, user_id: int) -> Optional[db_models.User]:
-    return db.query(db_models.User).filter(db_models.User.id == user_id).first()
+    # Session.get checks the identity map first, so a row already loaded in this
+    # session (e.g. by the auth dependency) doesn't cost another SELECT.
+    return db.get(db_models.User, user_id)
 
 def get_user_by_email(db: Session, email: str) -> Optional[db_models.User]:
     return db.query(db_models.User).filter(db_models.User.email == email).first()
 
 def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[db_models.User]:
-    return db.query(db_models.User).offset(skip).limit(limit).all()
+    return db.query(db_models.User).order_by(db_models.User.id).offset(skip).limit(limit).all()
 
+def apply_user_filters(query, filters: Optional[models.UserFilter]):
+    """ Adds UserFilter conditions to a select()/query over User. Shared with crud_async. """
+    if filters is None:
+        return query
+    User = db_models.User
+    if filters.is_active is not None:
+        query = query.where(User.is_active == filters.is_active)
+    if filters.is_google_user is not None:
+        query = query.where(User.is_google_user == filters.is_google_user)
+    if filters.email_prefix:
+        # The range lets the email index do the work; startswith keeps it exact
+        query = query.where(
+            User.email >= filters.email_prefix,
+            User.email < filters.email_prefix + "\uffff",
+            User.email.startswith(filters.email_prefix, autoescape=True),
+        )
+    if filters.scope:
+        # Indexed lookup on the normalized user_scopes table
+        query = query.where(User.id.in_(
+            select(db_models.UserScope.user_id).where(db_models.UserScope.scope == filters.scope)
+        ))
+    return query
 
-def create_user(db: Session, user: models.UserCreateInternal) -> db_models.User:
-    hashed_password = crypto.get_password_hash(user.password) if user.password else None
-    db_user = db_models.User(
+
+def build_user(user: models.UserCreateInternal, hashed_password: Optional[str]) -> db_models.User:
+    """ Builds (but doesn't persist) a User row. Shared with crud_async. """
+    email_filter.add(user.email) # Before commit: a failed insert only leaves a harmless false positive
+    return db_models.User(
         email=user.email,
         name=user.name,
         hashed_password=hashed_password,
@@ -25,31 +53,60 @@ def create_user(db: Session, user: models.UserCreateInternal) -> db_models.User:
         is_active=user.is_active,
         is_google_user=user.is_google_user
     )
+
+def create_user(db: Session, user: models.UserCreateInternal) -> db_models.User:
+    hashed_password = crypto.get_password_hash(user.password) if user.password else None
+    db_user = build_user(user, hashed_password)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
 
-def update_user(db: Session, user_id: int, user_update: models.UserUpdate) -> Optional[db_models.User]:
-    db_user = get_user(db, user_id)
-    if not db_user:
-        return None
-
-    update_data = user_update.model_dump(exclude_unset=True) # Use model_dump in Pydantic V2
-
-    if "password" in update_data and update_data["password"]:
-        hashed_password = crypto.get_password_hash(update_data["password"])
+def apply_user_update(db_user: db_models.User, update_data: dict, hashed_password: Optional[str]) -> None:
+    """
+    Applies a UserUpdate dump (password already hashed by the caller) to a row in place,
+    bumping the revocation epoch when needed. Shared with crud_async.
+    """
+    revoke_tokens = False
+    if hashed_password:
         db_user.hashed_password = hashed_password
         # If password is set/updated, maybe remove the Google user flag? Or handle logic as needed.
         # db_user.is_google_user = False
-        del update_data["password"] # Don't try to set it directly below
+        revoke_tokens = True
+    update_data.pop("password", None) # Don't try to set it directly below
+
+    if "scopes" in update_data and update_data["scopes"] != db_user.scopes:
+        revoke_tokens = True
+    if "is_active" in update_data and update_data["is_active"] != db_user.is_active:
+        revoke_tokens = True
 
+    if update_data.get("email"):
+        email_filter.add(update_data["email"])
     for key, value in update_data.items():
         setattr(db_user, key, value)
 
+    if revoke_tokens:
+        # Bump the revocation epoch so previously issued tokens stop validating
+        db_user.token_version = (db_user.token_version or 0) + 1
+
+def update_user(db: Session, user_id: int, user_update: models.UserUpdate) -> Optional[db_models.User]:
+    db_user = get_user(db, user_id)
+    if not db_user:
+        return None
+
+    update_data = user_update.model_dump(exclude_unset=True) # Use model_dump in Pydantic V2
+    hashed_password = crypto.get_password_hash(update_data["password"]) if update_data.get("password") else None
+    ends_sessions = hashed_password is not None or update_data.get("is_active") is False
+    apply_user_update(db_user, update_data, hashed_password)
+    if ends_sessions: # Password change or deactivation logs the user out everywhere
+        db.query(db_models.RefreshToken).filter(
+            db_models.RefreshToken.user_id == user_id, db_models.RefreshToken.revoked_at.is_(None)
+        ).update({"revoked_at": datetime.now(timezone.utc)}, synchronize_session=False)
+
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    user_cache.invalidate_user(user_id) # Scopes/active flag may have changed
     return db_user
 
 def delete_user(db: Session, user_id: int) -> Optional[db_models.User]:
@@ -57,22 +114,25 @@ def delete_user(db: Session, user_id: int) -> Optional[db_models.User]:
     if db_user:
         db.delete(db_user)
         db.commit()
+        user_cache.invalidate_user(user_id)
+        user_cache.frontend_data_version_cache.invalidate(user_id)
     return db_user
 
 # --- Cookies/Frontend Data CRUD ---
 
-def update_user_frontend_data(db: Session, user_id: int, data: dict) -> Optional[db_models.User]:
-    db_user = get_user(db, user_id)
-    if not db_user:
-        return None
-    db_user.frontend_data = data # Overwrite existing data
-    db.add(db_user)
+def update_user_frontend_data(db: Session, user_id: int, data: dict) -> db_models.UserFrontendData:
+    db_data = db.get(db_models.UserFrontendData, user_id)
+    if db_data is None:
+        db_data = db_models.UserFrontendData(user_id=user_id, version=0)
+    db_data.data = data # Overwrite existing data
+    db_data.version = (db_data.version or 0) + 1
+    db.add(db_data)
     db.commit()
-    db.refresh(db_user)
-    return db_user
+    db.refresh(db_data)
+    # The users row is untouched, so the status cache stays valid
+    user_cache.frontend_data_version_cache.set(user_id, db_data.version)
+    return db_data
 
-def get_user_frontend_data(db: Session, user_id: int) -> Optional[dict]:
-     db_user = get_user(db, user_id)
-     if not db_user:
-         return None
-     return db_user.frontend_data or {} # Return empty dict if null/not set
\ No newline at end of file
+def get_user_frontend_data(db: Session, user_id: int) -> dict:
+    db_data = db.get(db_models.UserFrontendData, user_id)
+    return (db_data.data if db_data else None) or {} # Return empty dict if null/not set
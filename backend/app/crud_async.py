@@ -0,0 +1,516 @@
+"""
+Async variants of the functions in crud.py, for use with an AsyncSession
+from database.get_async_db. Row-building logic is shared with crud.py.
+"""
+from sqlalchemy import select, insert, delete, update, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import database, db_models, models
+from .crud import build_user, apply_user_update, apply_user_filters
+from .auth import crypto, email_filter, user_cache
+from .config import settings
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import asyncio
+import time
+import uuid
+
+# --- User CRUD ---
+
+async def get_user(db: AsyncSession, user_id: int) -> Optional[db_models.User]:
+    # AsyncSession.get checks the identity map first (see crud.get_user)
+    return await db.get(db_models.User, user_id)
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[db_models.User]:
+    result = await db.execute(select(db_models.User).where(db_models.User.email == email))
+    return result.scalars().first()
+
+async def get_users(
+    db: AsyncSession, skip: int = 0, limit: int = 100, filters: Optional[models.UserFilter] = None
+) -> List[db_models.User]:
+    query = apply_user_filters(select(db_models.User), filters)
+    result = await db.execute(query.order_by(db_models.User.id).offset(skip).limit(limit))
+    return list(result.scalars().all())
+
+async def get_user_status_rows(db: AsyncSession, user_ids: List[int]) -> List[Any]:
+    """ id, is_active, scopes and token_version of many users in one query, without building ORM objects. """
+    User = db_models.User
+    result = await db.execute(
+        select(User.id, User.is_active, User.scopes, User.token_version).where(User.id.in_(user_ids))
+    )
+    return result.all()
+
+async def get_users_page(
+    db: AsyncSession,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    filters: Optional[models.UserFilter] = None,
+) -> List[db_models.User]:
+    """ Keyset pagination on id: cost doesn't grow with how deep the page is. """
+    query = apply_user_filters(select(db_models.User), filters)
+    if after_id is not None:
+        query = query.where(db_models.User.id > after_id)
+    result = await db.execute(query.order_by(db_models.User.id).limit(limit))
+    return list(result.scalars().all())
+
+USER_EXPORT_COLUMNS = ("id", "email", "name", "scopes", "is_active", "is_google_user", "created_at", "updated_at")
+
+async def get_user_export_rows(
+    db: AsyncSession, limit: int, after_id: Optional[int] = None, filters: Optional[models.UserFilter] = None
+) -> List[Any]:
+    """ One keyset page of USER_EXPORT_COLUMNS as plain row tuples (no ORM objects), ordered by id. """
+    User = db_models.User
+    query = apply_user_filters(select(*(getattr(User, column) for column in USER_EXPORT_COLUMNS)), filters)
+    if after_id is not None:
+        query = query.where(User.id > after_id)
+    result = await db.execute(query.order_by(User.id).limit(limit))
+    return result.all()
+
+
+async def create_user(db: AsyncSession, user: models.UserCreateInternal) -> db_models.User:
+    hashed_password = await crypto.hash_password_async(user.password) if user.password else None
+    db_user = build_user(user, hashed_password)
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+async def import_users(db: AsyncSession, users: List[models.UserImportRow]) -> Dict[str, Optional[int]]:
+    """
+    Bulk create for imports: one query finds already-registered emails, passwords of the
+    rest are hashed in parallel, and all rows go in with one executemany per table in a
+    single transaction. Emails must be unique within `users`.
+    Returns email -> new id, or None where the email was already registered.
+    """
+    User, UserScope = db_models.User, db_models.UserScope
+    hashes: Dict[str, str] = {}
+    for attempt in range(2): # Retried once if a concurrent signup takes an email between check and insert
+        existing = set((await db.scalars(select(User.email).where(User.email.in_([u.email for u in users])))).all())
+        new_users = [u for u in users if u.email not in existing]
+        to_hash = [u for u in new_users if u.password is not None and u.email not in hashes]
+        hashes.update(zip((u.email for u in to_hash), await crypto.hash_passwords_async([u.password for u in to_hash])))
+        if not new_users:
+            return {u.email: None for u in users}
+        try:
+            # Bulk INSERT doesn't fire the per-row ORM sync events, so user_scopes is written here too
+            result = await db.execute(insert(User).returning(User.id, sort_by_parameter_order=True), [
+                {
+                    "email": u.email,
+                    "name": u.name,
+                    "hashed_password": u.password_hash or hashes[u.email],
+                    "scopes": u.scopes,
+                    "is_active": u.is_active,
+                    "is_google_user": False,
+                }
+                for u in new_users
+            ])
+            ids = dict(zip((u.email for u in new_users), result.scalars().all()))
+            scope_rows = [{"user_id": ids[u.email], "scope": scope} for u in new_users for scope in set(u.scopes)]
+            if scope_rows:
+                await db.execute(insert(UserScope), scope_rows)
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            if attempt:
+                raise
+            continue
+        for u in new_users:
+            email_filter.add(u.email)
+        return {u.email: ids.get(u.email) for u in users}
+
+async def update_user(db: AsyncSession, user_id: int, user_update: models.UserUpdate) -> Optional[db_models.User]:
+    db_user = await get_user(db, user_id)
+    if not db_user:
+        return None
+
+    update_data = user_update.model_dump(exclude_unset=True)
+    hashed_password = await crypto.hash_password_async(update_data["password"]) if update_data.get("password") else None
+    ends_sessions = hashed_password is not None or update_data.get("is_active") is False
+    apply_user_update(db_user, update_data, hashed_password)
+    if ends_sessions: # Password change or deactivation logs the user out everywhere
+        await revoke_user_refresh_tokens(db, user_id, commit=False)
+
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    user_cache.invalidate_user(user_id) # Scopes/active flag may have changed
+    return db_user
+
+async def upgrade_password_hash(db: AsyncSession, user_id: int, old_hash: str, new_hash: str) -> bool:
+    """
+    Swaps in a rehash of the same password (stronger scheme/cost). Conditional on the old
+    hash, so a password change that lands first wins. The password is unchanged, so
+    sessions and tokens are left alone.
+    """
+    User = db_models.User
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id, User.hashed_password == old_hash)
+        .values(hashed_password=new_hash)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+async def delete_user(db: AsyncSession, user_id: int) -> Optional[db_models.User]:
+    db_user = await get_user(db, user_id)
+    if db_user:
+        await db.delete(db_user)
+        await db.commit()
+        user_cache.invalidate_user(user_id)
+        user_cache.frontend_data_version_cache.invalidate(user_id)
+    return db_user
+
+# --- Bulk scope grants/revokes and batch updates ---
+
+BATCH_CHUNK_SIZE = 5000 # Ids per IN (...) list, well under SQLite's bound-parameter limit
+
+async def _change_scope_for_users(db: AsyncSession, scope: str, user_ids: List[int], grant: bool) -> List[int]:
+    """
+    Set-based grant/revoke of one scope. Touches only users whose scopes actually change,
+    updates user_scopes and the denormalized User.scopes together, and bumps each affected
+    user's revocation epoch. Doesn't commit; returns the ids that changed.
+    """
+    User, UserScope = db_models.User, db_models.UserScope
+    # Lock the rows first (FOR UPDATE where supported; SQLite serializes writers anyway), in id
+    # order so concurrent batches can't deadlock. Holders are read after the locks are held,
+    # so a grant/revoke that committed meanwhile is seen rather than overwritten.
+    locked = (await db.execute(
+        select(User.id, User.scopes, User.token_version)
+        .where(User.id.in_(set(user_ids)))
+        .order_by(User.id)
+        .with_for_update()
+    )).all()
+    holders = set((await db.scalars(
+        select(UserScope.user_id).where(UserScope.scope == scope, UserScope.user_id.in_([row.id for row in locked]))
+    )).all())
+    affected = [row for row in locked if (row.id not in holders) == grant]
+    if not affected:
+        return []
+
+    affected_ids = [row.id for row in affected]
+    if grant:
+        await db.execute(insert(UserScope), [{"user_id": user_id, "scope": scope} for user_id in affected_ids])
+    else:
+        await db.execute(delete(UserScope).where(UserScope.scope == scope, UserScope.user_id.in_(affected_ids)))
+
+    # Rebuild the JSON column from user_scopes (the rows just written, in this transaction),
+    # keeping the existing order and appending new scopes
+    current: Dict[int, set] = {user_id: set() for user_id in affected_ids}
+    for user_id, user_scope in await db.execute(
+        select(UserScope.user_id, UserScope.scope).where(UserScope.user_id.in_(affected_ids))
+    ):
+        current[user_id].add(user_scope)
+
+    def _scopes(row) -> List[str]:
+        kept = [s for s in dict.fromkeys(row.scopes or []) if s in current[row.id]]
+        return kept + sorted(current[row.id] - set(kept))
+
+    # Bulk UPDATE by primary key (one executemany); doesn't fire the per-row ORM sync events
+    await db.execute(update(User), [
+        {"id": row.id, "scopes": _scopes(row), "token_version": (row.token_version or 0) + 1}
+        for row in affected
+    ])
+    return affected_ids
+
+async def _set_active_for_users(db: AsyncSession, user_ids: List[int], is_active: bool) -> List[int]:
+    """
+    One UPDATE for every user whose active flag differs, bumping their revocation epoch.
+    Deactivation also revokes their refresh tokens, like update_user. Doesn't commit.
+    """
+    User, RefreshToken = db_models.User, db_models.RefreshToken
+    changing = [User.id.in_(user_ids), User.is_active.is_not(is_active)]
+    if not is_active:
+        await db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.user_id.in_(select(User.id).where(*changing)), RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=datetime.now(timezone.utc))
+            .execution_options(synchronize_session=False)
+        )
+    result = await db.execute(
+        update(User)
+        .where(*changing)
+        .values(is_active=is_active, token_version=func.coalesce(User.token_version, 0) + 1)
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
+    return list(result.scalars().all())
+
+def _invalidate_users(user_ids) -> None:
+    # After commit, so a concurrent read can't cache the old row again
+    for user_id in user_ids:
+        user_cache.invalidate_user(user_id)
+
+async def grant_scope(db: AsyncSession, scope: str, user_ids: List[int]) -> int:
+    affected_ids = await _change_scope_for_users(db, scope, user_ids, grant=True)
+    await db.commit()
+    _invalidate_users(affected_ids)
+    return len(affected_ids)
+
+async def revoke_scope(db: AsyncSession, scope: str, user_ids: List[int]) -> int:
+    affected_ids = await _change_scope_for_users(db, scope, user_ids, grant=False)
+    await db.commit()
+    _invalidate_users(affected_ids)
+    return len(affected_ids)
+
+async def resolve_user_ids(
+    db: AsyncSession, user_ids: Optional[List[int]] = None, filters: Optional[models.UserFilter] = None
+) -> List[int]:
+    """ Ids of the existing users among user_ids, or of those matching filters, in id order. """
+    User = db_models.User
+    if user_ids is not None:
+        unique_ids = sorted(set(user_ids))
+        found: List[int] = []
+        for i in range(0, len(unique_ids), BATCH_CHUNK_SIZE):
+            chunk = unique_ids[i:i + BATCH_CHUNK_SIZE]
+            found.extend((await db.scalars(select(User.id).where(User.id.in_(chunk)).order_by(User.id))).all())
+        return found
+    return list((await db.scalars(apply_user_filters(select(User.id), filters).order_by(User.id))).all())
+
+async def batch_update_users(
+    db: AsyncSession,
+    user_ids: List[int],
+    add_scopes: List[str],
+    remove_scopes: List[str],
+    is_active: Optional[bool],
+) -> models.UserBatchUpdateResult:
+    """
+    Applies scope grants/revokes and an active flag to many users in one transaction,
+    with set-based statements per chunk of ids (see resolve_user_ids for picking them).
+    """
+    granted = dict.fromkeys(add_scopes, 0)
+    revoked = dict.fromkeys(remove_scopes, 0)
+    changed_ids = set()
+    active_changed = 0
+    for i in range(0, len(user_ids), BATCH_CHUNK_SIZE):
+        chunk = user_ids[i:i + BATCH_CHUNK_SIZE]
+        for scope in add_scopes:
+            affected_ids = await _change_scope_for_users(db, scope, chunk, grant=True)
+            granted[scope] += len(affected_ids)
+            changed_ids.update(affected_ids)
+        for scope in remove_scopes:
+            affected_ids = await _change_scope_for_users(db, scope, chunk, grant=False)
+            revoked[scope] += len(affected_ids)
+            changed_ids.update(affected_ids)
+        if is_active is not None:
+            affected_ids = await _set_active_for_users(db, chunk, is_active)
+            active_changed += len(affected_ids)
+            changed_ids.update(affected_ids)
+    await db.commit()
+    _invalidate_users(changed_ids)
+    return models.UserBatchUpdateResult(
+        matched=len(user_ids), updated=len(changed_ids), granted=granted, revoked=revoked, active_changed=active_changed
+    )
+
+# --- Refresh tokens ---
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes even for timezone-aware columns
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+async def create_refresh_token(db: AsyncSession, user_id: int, family_id: Optional[str] = None, commit: bool = True) -> str:
+    """ Stores a new refresh token (hashed) and returns its plaintext value. """
+    token = crypto.generate_refresh_token()
+    db.add(db_models.RefreshToken(
+        user_id=user_id,
+        token_hash=crypto.hash_refresh_token(token),
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=datetime.now(timezone.utc) + timedelta(days=settings.refresh_token_expire_days),
+    ))
+    if commit:
+        await db.commit()
+    return token
+
+async def revoke_refresh_token_family(db: AsyncSession, family_id: str, commit: bool = True) -> None:
+    RefreshToken = db_models.RefreshToken
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    if commit:
+        await db.commit()
+
+async def revoke_user_refresh_tokens(db: AsyncSession, user_id: int, commit: bool = True) -> None:
+    RefreshToken = db_models.RefreshToken
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    if commit:
+        await db.commit()
+
+async def get_refresh_token(db: AsyncSession, token: str) -> Optional[db_models.RefreshToken]:
+    result = await db.execute(
+        select(db_models.RefreshToken).where(db_models.RefreshToken.token_hash == crypto.hash_refresh_token(token))
+    )
+    return result.scalars().first()
+
+async def rotate_refresh_token(db: AsyncSession, token: str) -> Optional[Tuple[db_models.User, str]]:
+    """
+    Exchanges a refresh token for a new one in the same family. Returns (user, new_token),
+    or None if the token is unknown, expired, revoked or the user can't log in. Presenting
+    an already-used token is treated as theft: the whole family is revoked.
+    """
+    RefreshToken = db_models.RefreshToken
+    stored = await get_refresh_token(db, token)
+    if stored is None:
+        return None
+    if stored.revoked_at is not None:
+        await revoke_refresh_token_family(db, stored.family_id) # Reuse detected
+        return None
+    now = datetime.now(timezone.utc)
+    if _as_utc(stored.expires_at) <= now:
+        return None
+
+    # Conditional update so two concurrent refreshes can't both win
+    result = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == stored.id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        await revoke_refresh_token_family(db, stored.family_id)
+        return None
+
+    user = await get_user(db, stored.user_id)
+    if user is None or not user.is_active:
+        await revoke_refresh_token_family(db, stored.family_id)
+        return None
+    new_token = await create_refresh_token(db, user.id, family_id=stored.family_id, commit=False)
+    await db.commit()
+    _schedule_refresh_token_prune()
+    return user, new_token
+
+async def prune_refresh_tokens(db: AsyncSession) -> int:
+    """
+    Deletes up to refresh_token_prune_batch_size expired tokens and tokens revoked longer than
+    refresh_token_revoked_retention_days ago. Returns the number deleted.
+    """
+    RefreshToken = db_models.RefreshToken
+    now = datetime.now(timezone.utc)
+    revoked_before = now - timedelta(days=settings.refresh_token_revoked_retention_days)
+    prunable = (
+        select(RefreshToken.id)
+        .where((RefreshToken.expires_at <= now) | (RefreshToken.revoked_at <= revoked_before))
+        .limit(settings.refresh_token_prune_batch_size)
+    )
+    # Batched, so a large backlog is worked off over several runs without one long-held lock
+    result = await db.execute(
+        delete(RefreshToken).where(RefreshToken.id.in_(prunable)).execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+_refresh_tokens_pruned_at = 0.0
+_refresh_token_prune_task: Optional[asyncio.Task] = None
+
+async def _prune_refresh_tokens_in_background() -> None:
+    try:
+        async with database.AsyncSessionLocal() as db:
+            await prune_refresh_tokens(db)
+    except Exception as e: # Retried after the next interval
+        print(f"Warning: Could not prune refresh tokens: {e}")
+
+def _schedule_refresh_token_prune() -> None:
+    global _refresh_tokens_pruned_at, _refresh_token_prune_task
+    interval = settings.refresh_token_prune_interval_seconds
+    if interval <= 0 or time.monotonic() - _refresh_tokens_pruned_at < interval:
+        return
+    if _refresh_token_prune_task is None or _refresh_token_prune_task.done():
+        _refresh_tokens_pruned_at = time.monotonic()
+        _refresh_token_prune_task = asyncio.create_task(_prune_refresh_tokens_in_background())
+
+# --- Cookies/Frontend Data CRUD ---
+# Stored in user_frontend_data. Writes are compare-and-swap on its version column, so
+# concurrent tabs can't silently overwrite each other's changes.
+
+async def get_user_frontend_data(db: AsyncSession, user_id: int) -> dict:
+    return (await get_user_frontend_data_with_version(db, user_id))[0]
+
+async def get_user_frontend_data_with_version(db: AsyncSession, user_id: int) -> Tuple[dict, int]:
+    """ (data, version); ({}, 0) if nothing was stored yet. """
+    FrontendData = db_models.UserFrontendData
+    row = (await db.execute(
+        select(FrontendData.data, FrontendData.version).where(FrontendData.user_id == user_id)
+    )).first()
+    if row is None:
+        return {}, 0
+    return row.data or {}, row.version or 0
+
+async def get_user_frontend_data_value(db: AsyncSession, user_id: int, key: str) -> Tuple[bool, Any]:
+    """ Reads a single top-level key server-side. Returns (found, value). """
+    FrontendData = db_models.UserFrontendData
+    value = (await db.execute(
+        select(FrontendData.data[key]).where(FrontendData.user_id == user_id)
+    )).scalar()
+    if value is not None:
+        return True, value
+    # NULL means either a missing key or an explicit null; only then look at the whole document
+    data = await get_user_frontend_data(db, user_id)
+    return key in data, data.get(key)
+
+async def _write_frontend_data(
+    db: AsyncSession, user_id: int, data: dict, expected_version: Optional[int], retry: bool = True
+) -> Optional[int]:
+    """ Writes data, bumping the version. Returns the new version, or None if expected_version is stale. """
+    FrontendData = db_models.UserFrontendData
+    query = update(FrontendData).where(FrontendData.user_id == user_id)
+    if expected_version is not None:
+        query = query.where(FrontendData.version == expected_version)
+    query = query.values(data=data, version=FrontendData.version + 1)
+    new_version = (await db.execute(
+        query.returning(FrontendData.version).execution_options(synchronize_session=False)
+    )).scalar()
+    if new_version is None:
+        if expected_version: # The row exists at another version (or not at all)
+            await db.rollback()
+            return None
+        # First write for this user creates the row
+        try:
+            await db.execute(insert(FrontendData).values(user_id=user_id, data=data, version=1))
+            new_version = 1
+        except IntegrityError: # Created concurrently by another request
+            await db.rollback()
+            if expected_version is None and retry:
+                return await _write_frontend_data(db, user_id, data, None, retry=False)
+            return None
+    await db.commit()
+    # The users row is untouched, so the status cache stays valid
+    user_cache.frontend_data_version_cache.set(user_id, new_version)
+    return new_version
+
+async def update_user_frontend_data(
+    db: AsyncSession, user_id: int, data: dict, expected_version: Optional[int] = None
+) -> Optional[int]:
+    """ Overwrites the whole document. Returns the new version, or None on a version mismatch. """
+    return await _write_frontend_data(db, user_id, data, expected_version)
+
+async def patch_user_frontend_data(
+    db: AsyncSession,
+    user_id: int,
+    apply_patch: Callable[[dict], dict],
+    expected_version: Optional[int] = None,
+    max_attempts: int = 5,
+) -> Optional[Tuple[dict, int]]:
+    """
+    Read-modify-write with optimistic concurrency. Without expected_version, a concurrent
+    write just causes the patch to be re-applied on the fresh document. Returns
+    (data, new_version), or None if expected_version is stale or retries ran out.
+    """
+    for _ in range(max_attempts):
+        data, version = await get_user_frontend_data_with_version(db, user_id)
+        if expected_version is not None and version != expected_version:
+            return None
+        new_data = apply_patch(data)
+        new_version = await _write_frontend_data(db, user_id, new_data, version)
+        if new_version is not None:
+            return new_data, new_version
+        if expected_version is not None:
+            return None
+    return None
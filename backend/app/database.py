@@ -1,13 +1,50 @@
-from sqlalchemy import create_engine
+import time
+from typing import Any, Dict
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from .config import settings
+from . import metrics
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def _pool_kwargs(url: str) -> Dict[str, Any]:
+    # In-memory SQLite uses a singleton/static pool that doesn't accept sizing options
+    if _is_sqlite(url) and (":memory:" in url or url.rstrip("/").endswith("sqlite:")):
+        return {}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+    }
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    # WAL lets readers proceed during a write; busy_timeout waits for the write lock
+    # instead of failing immediately with "database is locked".
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size_bytes)}")
+    cursor.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_size_kib)}") # Negative = KiB
+    cursor.close()
 
 engine = create_engine(
     settings.database_url,
     # Required for SQLite only:
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
+    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {},
+    **_pool_kwargs(settings.database_url),
 )
+if _is_sqlite(settings.database_url):
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -18,4 +55,57 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# --- Async engine (used by the async routes) ---
+
+def get_async_database_url(url: str) -> str:
+    """ Maps a sync URL onto its async driver: aiosqlite locally, asyncpg in production. """
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    if url.startswith("postgresql://") or url.startswith("postgres://"):
+        return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    return url # Already has an explicit driver (e.g. postgresql+asyncpg://)
+
+_async_url = settings.async_database_url or get_async_database_url(settings.database_url)
+async_engine = create_async_engine(_async_url, **_pool_kwargs(_async_url))
+if _is_sqlite(_async_url):
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._metrics_started_at = time.perf_counter()
+
+def _query_timer(engine_label: str):
+    def stop_query_timer(conn, cursor, statement, parameters, context, executemany) -> None:
+        started_at = getattr(context, "_metrics_started_at", None)
+        if started_at is not None:
+            metrics.db_query_seconds.observe(time.perf_counter() - started_at, engine=engine_label)
+    return stop_query_timer
+
+for _engine, _label in ((engine, "sync"), (async_engine.sync_engine, "async")):
+    event.listen(_engine, "before_cursor_execute", _start_query_timer)
+    event.listen(_engine, "after_cursor_execute", _query_timer(_label))
+
+# expire_on_commit=False: attributes stay loaded after commit, so routes can serialize
+# returned rows without triggering (unsupported) implicit IO on the event loop.
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Dependency to get an async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def pool_stats(db_engine: Engine) -> Dict[str, Any]:
+    """ Connection pool usage, for sizing db_pool_size/db_max_overflow. """
+    pool = db_engine.pool
+    if isinstance(pool, QueuePool): # Also covers the async-adapted queue pool
+        return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "max_overflow": settings.db_max_overflow,
+        }
+    return {"status": pool.status()}
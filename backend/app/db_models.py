@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, JSON, DateTime, func, Boolean
+from sqlalchemy import Column, Integer, String, JSON, DateTime, func, Boolean, Index, ForeignKey, event, inspect, delete, insert
 from sqlalchemy.ext.declarative import declarative_base
 import datetime
 Base = declarative_base()
@@ -13,7 +13,89 @@ class User(Base):
     scopes = Column(JSON, nullable=False, default=[]) # Store scopes as a JSON list
     is_active = Column(Boolean, default=True)
     is_google_user = Column(Boolean, default=False) # Flag for users created via Google
+    # Revocation epoch: bumped whenever scopes, active flag or password change.
+    # Tokens carry the value they were issued with ("ver" claim).
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    # Field to store frontend 'cookies' data
-    frontend_data = Column(JSON, nullable=True, default={})
+
+    __table_args__ = (
+        # Keyset pagination over filtered admin listings (WHERE flag = ? AND id > ? ORDER BY id)
+        Index("ix_users_is_active_id", "is_active", "id"),
+        Index("ix_users_is_google_user_id", "is_google_user", "id"),
+        # Incremental syncs of the known-email filter (auth/email_filter.py)
+        Index("ix_users_updated_at", "updated_at"),
+    )
+
+
+class UserScope(Base):
+    """
+    Normalized, indexed copy of User.scopes for "who has scope X" queries and bulk
+    grants/revokes. User.scopes stays the denormalized copy read on the auth path.
+    """
+    __tablename__ = "user_scopes"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    scope = Column(String, primary_key=True)
+
+    __table_args__ = (
+        Index("ix_user_scopes_scope_user_id", "scope", "user_id"),
+    )
+
+
+class UserFrontendData(Base):
+    """
+    Frontend 'cookies' data, kept out of the users row so the auth path (which loads
+    users on every token validation) never pulls a potentially large JSON blob.
+    """
+    __tablename__ = "user_frontend_data"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    data = Column(JSON, nullable=False, default={})
+    # Bumped on every write; exposed as the ETag for optimistic concurrency
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class RefreshToken(Base):
+    """
+    Opaque refresh tokens, stored as SHA-256 hashes. Each rotation marks the presented
+    token used and issues a new one in the same family; presenting a used token again
+    (reuse) revokes the whole family.
+    """
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True, index=True)
+    family_id = Column(String(32), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True) # Indexed for pruning
+    revoked_at = Column(DateTime(timezone=True), nullable=True, index=True) # Set when rotated, reused or logged out
+
+
+# Keep user_scopes in sync with User.scopes on every ORM flush (create, update, delete),
+# inside the same transaction. Set-based bulk operations in crud maintain both themselves.
+
+def _insert_scope_rows(connection, user_id: int, scopes) -> None:
+    rows = [{"user_id": user_id, "scope": scope} for scope in set(scopes or [])]
+    if rows:
+        connection.execute(insert(UserScope.__table__), rows)
+
+@event.listens_for(User, "after_insert")
+def _user_scopes_after_insert(mapper, connection, target):
+    _insert_scope_rows(connection, target.id, target.scopes)
+
+@event.listens_for(User, "after_update")
+def _user_scopes_after_update(mapper, connection, target):
+    if not inspect(target).attrs.scopes.history.has_changes():
+        return
+    connection.execute(delete(UserScope.__table__).where(UserScope.user_id == target.id))
+    _insert_scope_rows(connection, target.id, target.scopes)
+
+@event.listens_for(User, "after_delete")
+def _user_rows_after_delete(mapper, connection, target):
+    # Explicit because SQLite doesn't enforce ON DELETE CASCADE by default
+    connection.execute(delete(UserScope.__table__).where(UserScope.user_id == target.id))
+    connection.execute(delete(UserFrontendData.__table__).where(UserFrontendData.user_id == target.id))
+    connection.execute(delete(RefreshToken.__table__).where(RefreshToken.user_id == target.id))
@@ -0,0 +1,34 @@
+"""
+Helpers for ETag-based conditional requests (If-Match / If-None-Match).
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+# Per-user resources: let the browser store them, but revalidate every time
+CACHE_CONTROL = "private, no-cache"
+
+def version_etag(version: int) -> str:
+    return f'"v{version}"'
+
+def content_etag(content: bytes) -> str:
+    return '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """ Version required by an If-Match header; None when absent or "*". """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip().removeprefix("W/").strip('"')
+    if not tag.startswith("v") or not tag[1:].isdigit():
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Unrecognized If-Match value")
+    return int(tag[1:])
+
+def if_none_match_satisfied(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """ True when the client's copy is current, i.e. a 304 can be sent (weak comparison). """
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in if_none_match.split(","))
@@ -0,0 +1,50 @@
+"""
+One long-lived httpx.AsyncClient for outbound calls (Google OAuth).
+Reusing it keeps TCP/TLS connections alive between callbacks instead of paying a
+new handshake per request. Created/closed by the app lifespan in main.py.
+"""
+import importlib.util
+
+import httpx
+
+from .config import settings
+
+_client: httpx.AsyncClient | None = None
+
+def create_http_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    # HTTP/2 needs the optional 'h2' package (httpx[http2]); fall back to HTTP/1.1 keep-alive without it
+    http2 = settings.http_client_http2 and importlib.util.find_spec("h2") is not None
+    if settings.http_client_http2 and not http2:
+        print("Warning: http_client_http2 is enabled but 'h2' is not installed; using HTTP/1.1.")
+    return httpx.AsyncClient(
+        http2=http2,
+        transport=transport, # Tests can pass an httpx.MockTransport here
+        limits=httpx.Limits(
+            max_connections=settings.http_client_max_connections,
+            max_keepalive_connections=settings.http_client_max_keepalive_connections,
+            keepalive_expiry=settings.http_client_keepalive_expiry_seconds,
+        ),
+        timeout=httpx.Timeout(
+            settings.http_client_timeout_seconds,
+            connect=settings.http_client_connect_timeout_seconds,
+        ),
+    )
+
+async def init_http_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    """ (Re)creates the shared client. Replaces and closes any existing one. """
+    global _client
+    await close_http_client()
+    _client = create_http_client(transport)
+    return _client
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None: # E.g. when used outside the app lifespan (scripts)
+        _client = create_http_client()
+    return _client
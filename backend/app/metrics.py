@@ -0,0 +1,202 @@
+"""
+Minimal in-process metrics with Prometheus text exposition (served at /metrics).
+
+Counters and histograms are plain Python objects updated under a per-metric lock:
+an observation is a bisect plus a few integer adds, cheap enough to leave on in
+production. Gauges are read from callbacks at scrape time, so they cost nothing
+between scrapes.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+# Default latency buckets (seconds): sub-millisecond cache hits up to multi-second outliers
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name, self.documentation, self.label_names = name, documentation, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}_total{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.documentation, self.label_names = name, documentation, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {} # labels -> [count per bucket..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(labels[name] for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value) # First bucket with upper bound >= value
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(values[-1])}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}"
+
+
+class Gauge:
+    """ Read at scrape time from a callback returning {label values: value}. """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], read: Callable[[], Dict[Tuple[str, ...], float]]):
+        self.name, self.documentation, self.label_names = name, documentation, tuple(labels)
+        self._read = read
+
+    def samples(self) -> Iterable[str]:
+        try:
+            values = self._read()
+        except Exception: # A broken gauge shouldn't break the whole scrape
+            return
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+
+
+_registry: Dict[str, object] = {}
+
+def _register(metric):
+    return _registry.setdefault(metric.name, metric)
+
+def counter(name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+    return _register(Counter(name, documentation, labels))
+
+def histogram(name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return _register(Histogram(name, documentation, labels, buckets))
+
+def gauge(name: str, documentation: str, labels: Sequence[str], read: Callable[[], Dict[Tuple[str, ...], float]]) -> Gauge:
+    return _register(Gauge(name, documentation, labels, read))
+
+def render() -> str:
+    """ All registered metrics in the Prometheus text format (version 0.0.4). """
+    lines = []
+    for metric in _registry.values():
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# --- Hot-path metrics, updated by the modules that own the work ---
+
+http_request_seconds = histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status")
+)
+password_hash_seconds = histogram(
+    "password_hash_duration_seconds", "Password verify/hash time in the worker pool", ("operation",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.5, 5.0),
+)
+password_hash_wait_seconds = histogram(
+    "password_hash_queue_wait_seconds", "Time password jobs waited for a free pool slot", ("operation",)
+)
+jwt_seconds = histogram(
+    "jwt_duration_seconds", "JWT encode/decode time (signature work only)", ("operation",),
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01),
+)
+jwt_verified_cache = counter("jwt_verified_cache", "Verified-token cache lookups", ("result",))
+db_query_seconds = histogram("db_query_duration_seconds", "SQL statement execution time", ("engine",))
+google_request_seconds = histogram("google_request_duration_seconds", "Outbound calls to Google", ("endpoint",))
+
+
+def route_template(scope) -> str:
+    """
+    Full path template of the matched route (e.g. /api/v1/users/{user_id}), or "unmatched".
+    Newer FastAPI versions keep included routers nested, so route.path is only the part
+    below the router prefix; the prefix is recovered from the concrete request path.
+    """
+    route = scope.get("route")
+    path_format = getattr(route, "path_format", None)
+    if path_format is None:
+        return "unmatched"
+    path = scope.get("path", "")
+    try:
+        suffix = path_format.format(**{name: str(value) for name, value in scope.get("path_params", {}).items()})
+    except (KeyError, IndexError, ValueError):
+        return path_format
+    if suffix and not path.endswith(suffix):
+        return path_format
+    return path[:len(path) - len(suffix)] + path_format
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware timing each HTTP request. Labels use the matched route
+    template (see route_template), so series don't grow with path params.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_seconds.observe(
+                time.perf_counter() - started, method=scope["method"], route=route_template(scope), status=str(status_code)
+            )
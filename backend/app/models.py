@@ -1,15 +1,35 @@
-from pydantic import BaseModel, EmailStr, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, EmailStr, Field, model_validator
+from typing import List, Literal, Optional, Dict, Any
 import datetime
 
 # --- Token ---
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None # Only when refresh_token_in_body is enabled
+
+class RefreshRequest(BaseModel): # For clients that don't use the refresh cookie
+    refresh_token: str
 
 class TokenData(BaseModel):
     user_id: int | None = None
     scopes: List[str] = []
+    token_version: int = 0
+    exp: int | None = None
+
+class IntrospectionBatchRequest(BaseModel):
+    tokens: List[str] = Field(min_length=1, max_length=1000)
+
+class IntrospectionResult(BaseModel): # RFC 7662; inactive tokens carry only active=false
+    active: bool
+    sub: Optional[str] = None
+    scope: Optional[str] = None # Space-separated, as RFC 7662 specifies
+    scopes: Optional[List[str]] = None
+    exp: Optional[int] = None
+    token_type: Optional[str] = None
+
+class IntrospectionBatchResult(BaseModel):
+    results: List[IntrospectionResult] # In request order
 
 # --- User ---
 class UserBase(BaseModel):
@@ -48,6 +68,69 @@ class UserPrivate(UserInDBBase): # Data safe to return to the user themselves
     # If you had sensitive fields only the user should see, add them here
     pass
 
+class UserFilter(BaseModel): # Server-side filters for admin listings
+    is_active: Optional[bool] = None
+    is_google_user: Optional[bool] = None
+    email_prefix: Optional[str] = None
+    scope: Optional[str] = None
+
+class ScopeBulkChange(BaseModel): # Grant/revoke one scope for many users
+    scope: str = Field(min_length=1)
+    user_ids: List[int] = Field(min_length=1, max_length=10000)
+
+class BulkUpdateResult(BaseModel):
+    affected: int
+
+class UserBatchUpdate(BaseModel): # Set-based changes for many users: pick them by ids or by filter
+    user_ids: Optional[List[int]] = Field(None, min_length=1, max_length=10000)
+    filter: Optional[UserFilter] = None
+    add_scopes: List[str] = Field([], max_length=100)
+    remove_scopes: List[str] = Field([], max_length=100)
+    is_active: Optional[bool] = None
+
+    @model_validator(mode="after")
+    def check_batch(self):
+        if (self.user_ids is None) == (self.filter is None):
+            raise ValueError("Exactly one of user_ids or filter is required")
+        if self.filter is not None and not self.filter.model_dump(exclude_none=True):
+            raise ValueError("filter needs at least one condition") # Guards against updating every user by accident
+        if not (self.add_scopes or self.remove_scopes or self.is_active is not None):
+            raise ValueError("Nothing to change")
+        if any(not scope for scope in self.add_scopes + self.remove_scopes):
+            raise ValueError("Scopes must be non-empty")
+        if set(self.add_scopes) & set(self.remove_scopes):
+            raise ValueError("A scope can't be both added and removed")
+        self.add_scopes, self.remove_scopes = list(dict.fromkeys(self.add_scopes)), list(dict.fromkeys(self.remove_scopes))
+        return self
+
+class UserBatchUpdateResult(BaseModel):
+    matched: int # Users selected by user_ids (existing ones) or filter
+    updated: int # Users changed by any operation
+    granted: Dict[str, int] # scope -> users that gained it
+    revoked: Dict[str, int] # scope -> users that lost it
+    active_changed: int # Users whose is_active flag flipped
+
+class UserImportRow(UserBase): # One record of a bulk import (NDJSON object or CSV row)
+    password: Optional[str] = Field(None, min_length=8)
+    password_hash: Optional[str] = None # Existing bcrypt/argon2 hash, e.g. when migrating from another system
+
+    @model_validator(mode="after")
+    def check_password(self):
+        if (self.password is None) == (self.password_hash is None):
+            raise ValueError("Exactly one of password or password_hash is required")
+        return self
+
+class UserImportResult(BaseModel): # One NDJSON line per imported record, in input order
+    row: int # 1-based, counting data records (not CSV headers or blank lines)
+    status: Literal["created", "exists", "duplicate", "invalid"] # duplicate: repeated earlier in the same upload
+    email: Optional[str] = None
+    id: Optional[int] = None
+    error: Optional[str] = None
+
 # --- Cookies ---
 class CookiesData(BaseModel):
-    data: Dict[str, Any]
\ No newline at end of file
+    data: Dict[str, Any]
+
+class CookieValue(BaseModel): # Single key of the stored data
+    key: str
+    value: Any
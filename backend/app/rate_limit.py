@@ -0,0 +1,174 @@
+"""
+Rate limiting for the unauthenticated auth endpoints: token buckets per client IP
+(configured per route) and per login email, plus a sliding-window lockout after
+repeated failed logins. All checks run before any DB access or password hashing,
+so a credential-stuffing burst is turned away for the cost of a dict lookup.
+
+State lives in a RateLimitStore. The default MemoryRateLimitStore is per process;
+set rate_limit_store to "package.module:ClassName" to share state between workers
+(e.g. a Redis-backed implementation of the same interface).
+"""
+import importlib
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Callable, Deque, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+
+from .config import settings
+
+_PERIODS = {"s": 1, "second": 1, "m": 60, "minute": 60, "h": 3600, "hour": 3600}
+
+@lru_cache(maxsize=None)
+def parse_rate(rate: str) -> Optional[Tuple[float, float]]:
+    """ "20/60", "20/minute" -> (capacity, refill per second); None when empty or zero (disabled). """
+    if not rate:
+        return None
+    count, _, period = rate.partition("/")
+    seconds = _PERIODS.get(period.strip().lower()) or float(period)
+    capacity = float(count)
+    return (capacity, capacity / seconds) if capacity > 0 else None
+
+
+class RateLimitStore(ABC):
+    """ Interface for rate-limit state. Methods are async so shared stores can do IO. """
+
+    @abstractmethod
+    async def take(self, key: str, capacity: float, refill_per_second: float) -> float:
+        """ Takes one token from key's bucket. Returns 0 if allowed, else seconds until one is available. """
+
+    @abstractmethod
+    async def lockout_remaining(self, key: str, max_failures: int, window_seconds: float) -> float:
+        """ Seconds until key may try again, or 0 if it has fewer than max_failures within the window. """
+
+    @abstractmethod
+    async def add_failure(self, key: str, max_failures: int, window_seconds: float) -> None:
+        """ Records a failure for key, keeping the last max_failures within the window. """
+
+    @abstractmethod
+    async def clear_failures(self, key: str) -> None:
+        """ Forgets key's failures (after a successful login). """
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """ Per-process store. Least recently used keys are dropped beyond max_keys. """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict() # key -> (tokens, updated_at)
+        self._failures: "OrderedDict[str, Deque[float]]" = OrderedDict() # key -> recent failure times
+        self._lock = threading.Lock()
+
+    def _touch(self, data: OrderedDict, key: str) -> None:
+        data.move_to_end(key)
+        while len(data) > self.max_keys:
+            data.popitem(last=False)
+
+    async def take(self, key: str, capacity: float, refill_per_second: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            self._touch(self._buckets, key)
+        return 0.0 if allowed else (1 - tokens) / refill_per_second
+
+    async def lockout_remaining(self, key: str, max_failures: int, window_seconds: float) -> float:
+        with self._lock:
+            failures = self._failures.get(key)
+            if failures is None or len(failures) < max_failures:
+                return 0.0
+            # Locked until the oldest of the last max_failures failures leaves the window
+            return max(0.0, failures[-max_failures] + window_seconds - time.monotonic())
+
+    async def add_failure(self, key: str, max_failures: int, window_seconds: float) -> None:
+        with self._lock:
+            failures = self._failures.get(key)
+            if failures is None or failures.maxlen != max_failures:
+                failures = self._failures[key] = deque(failures or (), maxlen=max_failures)
+            failures.append(time.monotonic())
+            self._touch(self._failures, key)
+
+    async def clear_failures(self, key: str) -> None:
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+_store: Optional[RateLimitStore] = None
+
+def get_store() -> RateLimitStore:
+    global _store
+    if _store is None:
+        if settings.rate_limit_store == "memory":
+            _store = MemoryRateLimitStore(max_keys=settings.rate_limit_max_keys)
+        else:
+            module_name, _, class_name = settings.rate_limit_store.partition(":")
+            _store = getattr(importlib.import_module(module_name), class_name)()
+    return _store
+
+def client_ip(request: Request) -> str:
+    hops = settings.rate_limit_trusted_proxies
+    if hops > 0:
+        # Each proxy appends the address it saw, so only the last `hops` entries are trustworthy;
+        # anything to their left was sent by the client
+        header = ",".join(request.headers.getlist("x-forwarded-for"))
+        forwarded_for = [entry.strip() for entry in header.split(",") if entry.strip()]
+        if forwarded_for:
+            return forwarded_for[-min(hops, len(forwarded_for))]
+    return request.client.host if request.client else "unknown"
+
+def too_many_requests(retry_after: float, detail: str = "Too many requests") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+async def hit(key: str, rate: str) -> None:
+    """ Takes a token from key's bucket, raising 429 when it's empty. """
+    limit = parse_rate(rate)
+    if not settings.rate_limit_enabled or limit is None:
+        return
+    retry_after = await get_store().take(key, *limit)
+    if retry_after > 0:
+        raise too_many_requests(retry_after)
+
+def limit_by_ip(route: str) -> Callable:
+    """ Dependency enforcing settings.rate_limit_<route>_per_ip for the caller's IP. """
+    async def dependency(request: Request) -> None:
+        await hit(f"{route}:ip:{client_ip(request)}", getattr(settings, f"rate_limit_{route}_per_ip"))
+    return dependency
+
+# --- Login throttling ---
+
+def _email_key(email: str) -> str:
+    return email.strip().lower()
+
+async def check_login_allowed(email: str) -> None:
+    """ Per-email bucket and failed-attempt lockout. Call before looking up or verifying anything. """
+    if not settings.rate_limit_enabled:
+        return
+    email = _email_key(email)
+    if settings.login_lockout_max_failures > 0:
+        retry_after = await get_store().lockout_remaining(
+            f"login:failures:{email}", settings.login_lockout_max_failures, settings.login_lockout_window_seconds
+        )
+        if retry_after > 0:
+            raise too_many_requests(retry_after, detail="Too many failed login attempts")
+    await hit(f"login:email:{email}", settings.rate_limit_login_per_email)
+
+async def record_login_failure(email: str) -> None:
+    # Counted whether or not the account exists, so lockouts don't reveal which emails are registered
+    if settings.rate_limit_enabled and settings.login_lockout_max_failures > 0:
+        await get_store().add_failure(
+            f"login:failures:{_email_key(email)}", settings.login_lockout_max_failures, settings.login_lockout_window_seconds
+        )
+
+async def record_login_success(email: str) -> None:
+    if settings.rate_limit_enabled:
+        await get_store().clear_failures(f"login:failures:{_email_key(email)}")
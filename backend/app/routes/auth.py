@@ -1,41 +1,96 @@
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Form, Query, Response
+from typing import Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, status, Form, Query, Request, Response, Header, Cookie, Body, BackgroundTasks
+from fastapi.exceptions import RequestValidationError
 from fastapi.responses import RedirectResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 import urllib.parse
 import httpx
 import json  # Import the json module
+from pydantic import ValidationError
 
-from .. import crud, models
-from ..database import get_db
-from ..auth import auth_handler, crypto
+from .. import crud_async, models, etag, rate_limit
+from ..database import get_async_db, AsyncSessionLocal
+from ..auth import auth_handler, crypto, email_filter, user_cache
 from ..config import settings
 
 router = APIRouter()
 
-@router.post("/login", response_model=models.Token)
+def set_refresh_cookie(response: Response, refresh_token: str):
+    """ Delivers the refresh token as an HttpOnly cookie scoped to the auth routes """
+    response.set_cookie(
+        key=settings.refresh_cookie_name,
+        value=refresh_token,
+        httponly=True,
+        max_age=settings.refresh_token_expire_days * 24 * 60 * 60,
+        path=settings.refresh_cookie_path,
+        samesite=settings.refresh_cookie_samesite,
+        secure=settings.refresh_cookie_secure,
+    )
+
+def clear_refresh_cookie(response: Response):
+    response.delete_cookie(
+        key=settings.refresh_cookie_name,
+        path=settings.refresh_cookie_path,
+        samesite=settings.refresh_cookie_samesite,
+        secure=settings.refresh_cookie_secure,
+        httponly=True,
+    )
+
+def token_response(access_token: str, refresh_token: str) -> dict:
+    body = {"access_token": access_token, "token_type": "bearer"}
+    if settings.refresh_token_in_body: # For non-browser clients that can't hold the cookie
+        body["refresh_token"] = refresh_token
+    return body
+
+async def upgrade_password_hash(user_id: int, old_hash: str, password: str):
+    """ Background task: rehash with the current scheme/cost, in its own session (the request's is closed). """
+    try:
+        new_hash = await crypto.hash_password_async(password)
+        async with AsyncSessionLocal() as db:
+            await crud_async.upgrade_password_hash(db, user_id, old_hash, new_hash)
+    except Exception as e: # Best effort; the next login retries
+        print(f"Warning: Could not upgrade password hash for user {user_id}: {e}")
+
+@router.post(
+    "/login",
+    response_model=models.Token,
+    response_model_exclude_none=True,
+    dependencies=[Depends(rate_limit.limit_by_ip("login"))],
+)
 async def login_for_access_token(
     response: Response, # Inject Response object
+    background_tasks: BackgroundTasks,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = crud.get_user_by_email(db, email=form_data.username) # Use email as username
-    if not user or not user.hashed_password or not crypto.verify_password(form_data.password, user.hashed_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect email or password",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    # Throttle before the user lookup and bcrypt, so floods are rejected cheaply
+    await rate_limit.check_login_allowed(form_data.username)
+    login_failed = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Incorrect email or password",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    user = None
+    if await email_filter.might_exist(db, form_data.username): # Unknown emails skip the lookup entirely
+        user = await crud_async.get_user_by_email(db, email=form_data.username) # Use email as username
+    if not user or not user.hashed_password:
+        # Nothing to verify: answer after a typical bcrypt delay, without spending the CPU
+        await rate_limit.record_login_failure(form_data.username)
+        await crypto.pad_failed_verify()
+        raise login_failed
+    if not await crypto.verify_password_async(form_data.password, user.hashed_password):
+        await rate_limit.record_login_failure(form_data.username)
+        raise login_failed
+    if crypto.needs_rehash(user.hashed_password): # Old scheme or cost: upgrade after responding
+        background_tasks.add_task(upgrade_password_hash, user.id, user.hashed_password, form_data.password)
+    await rate_limit.record_login_success(form_data.username)
     if not user.is_active:
          raise HTTPException(status_code=400, detail="Inactive user")
 
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
-    access_token = auth_handler.create_access_token(
-        data={"sub": str(user.id), "scopes": user.scopes}, # Ensure sub is string, pass scopes
-        expires_delta=access_token_expires,
-    )
+    access_token = auth_handler.create_access_token_for_user(user, expires_delta=access_token_expires)
 
     # Set token in an HttpOnly cookie (more secure for web apps)
     # response.set_cookie(
@@ -48,11 +103,95 @@ async def login_for_access_token(
     #     secure=False # Set to True if using HTTPS
     # )
 
+    # Long-lived refresh token lets the client renew without re-sending the password
+    refresh_token = await crud_async.create_refresh_token(db, user.id)
+    set_refresh_cookie(response, refresh_token)
+
     # Return token in response body as well for SPA flexibility
-    return {"access_token": access_token, "token_type": "bearer"}
+    return token_response(access_token, refresh_token)
+
+
+@router.post(
+    "/refresh",
+    response_model=models.Token,
+    response_model_exclude_none=True,
+    dependencies=[Depends(rate_limit.limit_by_ip("refresh"))],
+)
+async def refresh_access_token(
+    response: Response,
+    payload: Optional[models.RefreshRequest] = Body(None),
+    refresh_cookie: Optional[str] = Cookie(None, alias=settings.refresh_cookie_name),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Exchanges a refresh token (cookie, or JSON body for non-browser clients) for a
+    new access token. The refresh token is rotated on every use; replaying an old
+    one revokes the whole session.
+    """
+    presented = payload.refresh_token if payload else refresh_cookie
+    rotated = await crud_async.rotate_refresh_token(db, presented) if presented else None
+    if rotated is None:
+        clear_refresh_cookie(response)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer", "Set-Cookie": response.headers["set-cookie"]},
+        )
+    user, refresh_token = rotated
+    access_token = auth_handler.create_access_token_for_user(
+        user, expires_delta=timedelta(minutes=settings.access_token_expire_minutes)
+    )
+    set_refresh_cookie(response, refresh_token)
+    return token_response(access_token, refresh_token)
 
 
-@router.get("/login/google")
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    response: Response,
+    payload: Optional[models.RefreshRequest] = Body(None),
+    refresh_cookie: Optional[str] = Cookie(None, alias=settings.refresh_cookie_name),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """ Revokes the presented refresh token's session and clears the cookie """
+    presented = payload.refresh_token if payload else refresh_cookie
+    if presented:
+        stored = await crud_async.get_refresh_token(db, presented)
+        if stored is not None:
+            await crud_async.revoke_refresh_token_family(db, stored.family_id)
+    clear_refresh_cookie(response)
+    return None
+
+
+@router.post(
+    "/introspect",
+    response_model=Union[models.IntrospectionResult, models.IntrospectionBatchResult],
+    response_model_exclude_none=True,
+)
+async def introspect(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    principal: auth_handler.Principal = Depends(auth_handler.require_introspection_scope)
+):
+    """
+    RFC 7662 token introspection for gateways. Send a form-encoded `token` for a single
+    result, or JSON `{"tokens": [...]}` to validate many tokens in one call.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == "application/x-www-form-urlencoded":
+        token = (await request.form()).get("token")
+        if not token:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing token parameter")
+        return (await auth_handler.introspect_tokens([token], db))[0]
+    if content_type == "application/json":
+        try:
+            batch = models.IntrospectionBatchRequest.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        return models.IntrospectionBatchResult(results=await auth_handler.introspect_tokens(batch.tokens, db))
+    raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported content type")
+
+
+@router.get("/login/google", dependencies=[Depends(rate_limit.limit_by_ip("google"))])
 async def login_via_google(
     redirect_uri: Optional[str] = Query(None), # Client app's desired redirect URI
     client_scope: Optional[str] = Query(None) # Scope(s) requested by the client app
@@ -71,15 +210,15 @@ async def login_via_google(
     return RedirectResponse(google_auth_url)
 
 
-@router.get("/google/callback")
+@router.get("/google/callback", dependencies=[Depends(rate_limit.limit_by_ip("google"))])
 async def auth_google_callback(
     code: str = Query(...),
     state: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
     ):
     try:
         token_data = await auth_handler.exchange_code_for_token(code)
-        user_info = await auth_handler.get_google_user_info(token_data['access_token'])
+        user_info = await auth_handler.get_google_identity(token_data)
 
         email = user_info.get("email")
         user_name = user_info.get("name")
@@ -88,7 +227,7 @@ async def auth_google_callback(
         if not email:
             raise HTTPException(status_code=400, detail="Email not provided by Google")
 
-        user = crud.get_user_by_email(db, email=email)
+        user = await crud_async.get_user_by_email(db, email=email)
 
         # Define default scopes for new Google users (can be empty)
         default_scopes = ["read:profile"] # Example scope
@@ -103,7 +242,7 @@ async def auth_google_callback(
                 is_active=True # Assume active on first login
                 # Password remains null
             )
-            user = crud.create_user(db, user_create)
+            user = await crud_async.create_user(db, user_create)
         elif not user.is_active:
              raise HTTPException(status_code=400, detail="User account is inactive")
         # else: User exists, potentially update details if needed
@@ -139,17 +278,18 @@ async def auth_google_callback(
 
         # Generate JWT for the user
         access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
-        access_token = auth_handler.create_access_token(
-            data={"sub": str(user.id), "scopes": user.scopes},
-            expires_delta=access_token_expires,
-        )
+        access_token = auth_handler.create_access_token_for_user(user, expires_delta=access_token_expires)
 
         # Redirect back to the *original client app* (or our frontend) with the token
         # Using URL fragment (#) is generally preferred for SPAs
         redirect_url = f"{client_redirect_uri}#access_token={access_token}&token_type=bearer&login_status={login_status}"
 
-        return RedirectResponse(redirect_url)
+        redirect = RedirectResponse(redirect_url)
+        set_refresh_cookie(redirect, await crud_async.create_refresh_token(db, user.id))
+        return redirect
 
+    except HTTPException:
+        raise # Already a proper client/server error, don't mask it as a 500
     except httpx.HTTPStatusError as e:
         # Log the error details from httpx
         print(f"HTTP Error during Google OAuth: {e.response.status_code} - {e.response.text}")
@@ -163,8 +303,26 @@ async def auth_google_callback(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred during Google sign-in.")
 
 @router.get("/me", response_model=models.UserPublic)
-async def read_users_me(current_user: models.UserPublic = Depends(auth_handler.get_current_active_user)):
+async def read_users_me(
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    principal: auth_handler.Principal = Depends(auth_handler.require_principal)
+):
     """
-    Get current logged-in user's public details.
+    Get current logged-in user's public details. Send the last ETag as
+    If-None-Match to get an empty 304 when nothing changed.
     """
+    user_id = principal.token_data.user_id
+    headers = {"Cache-Control": etag.CACHE_CONTROL}
+    # Fast path: the cached stamp lets us answer 304 without loading the user
+    cached_etag = user_cache.profile_etag_cache.get(user_id)
+    if etag.if_none_match_satisfied(if_none_match, cached_etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={**headers, "ETag": cached_etag})
+
+    current_user = models.UserPublic.model_validate(await principal.get_user())
+    headers["ETag"] = etag.content_etag(current_user.model_dump_json().encode())
+    user_cache.profile_etag_cache.set(user_id, headers["ETag"])
+    if etag.if_none_match_satisfied(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
     return current_user
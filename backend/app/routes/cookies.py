@@ -1,32 +1,143 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status, Header
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Any, Optional
+import copy
+import json
 
-from .. import crud, models, db_models
-from ..database import get_db
-from ..auth import auth_handler
+import jsonpatch
+
+from .. import crud_async, models, etag
+from ..database import get_async_db
+from ..auth import auth_handler, user_cache
 
 router = APIRouter()
 
+JSON_PATCH_MEDIA_TYPE = "application/json-patch+json" # RFC 6902
+MERGE_PATCH_MEDIA_TYPE = "application/merge-patch+json" # RFC 7396 (also used for plain application/json)
+
+def merge_patch(target: Any, patch: Any) -> Any:
+    """ RFC 7396 JSON Merge Patch: objects merge recursively, null deletes a key. """
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+precondition_failed = HTTPException(
+    status_code=status.HTTP_412_PRECONDITION_FAILED,
+    detail="Data was modified since it was read (version mismatch)",
+)
+
+
 @router.post("", status_code=status.HTTP_204_NO_CONTENT)
 async def save_frontend_data(
     payload: models.CookiesData,
-    db: Session = Depends(get_db),
-    current_user: db_models.User = Depends(auth_handler.get_current_active_user) # Require logged-in user
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    principal: auth_handler.Principal = Depends(auth_handler.require_principal) # Require logged-in user
 ):
-    """ Saves arbitrary JSON data associated with the logged-in user """
-    updated_user = crud.update_user_frontend_data(db, user_id=current_user.id, data=payload.data)
-    if not updated_user:
-        # This shouldn't happen if get_current_active_user works
-        raise HTTPException(status_code=404, detail="User not found while saving data")
+    """ Saves arbitrary JSON data associated with the logged-in user (full overwrite) """
+    new_version = await crud_async.update_user_frontend_data(
+        db, user_id=principal.token_data.user_id, data=payload.data, expected_version=etag.parse_if_match(if_match)
+    )
+    if new_version is None:
+        raise precondition_failed
+    response.headers["ETag"] = etag.version_etag(new_version)
     return None # Return 204 No Content
 
 
+@router.patch("", response_model=models.CookiesData)
+async def patch_frontend_data(
+    request: Request,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    principal: auth_handler.Principal = Depends(auth_handler.require_principal) # Require logged-in user
+):
+    """
+    Partially updates the stored data. Send a JSON Patch with Content-Type
+    application/json-patch+json, or a JSON Merge Patch (application/merge-patch+json
+    or application/json). Pass the ETag from a previous read as If-Match to fail with
+    412 instead of applying on top of someone else's change.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in (JSON_PATCH_MEDIA_TYPE, MERGE_PATCH_MEDIA_TYPE, "application/json"):
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Unsupported patch format")
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be valid JSON")
+
+    if content_type == JSON_PATCH_MEDIA_TYPE:
+        try:
+            patch = jsonpatch.JsonPatch(body)
+        except (jsonpatch.InvalidJsonPatch, TypeError):
+            raise HTTPException(status_code=422, detail="Invalid JSON Patch document")
+        apply_patch = lambda data: patch.apply(data) # Returns a patched copy
+    else:
+        apply_patch = lambda data: merge_patch(copy.deepcopy(data), body)
+
+    def checked_patch(data: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            result = apply_patch(data)
+        except jsonpatch.JsonPatchTestFailed as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        except (jsonpatch.JsonPatchException, jsonpatch.JsonPointerException) as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if not isinstance(result, dict):
+            raise HTTPException(status_code=422, detail="Patched data must be a JSON object")
+        return result
+
+    patched = await crud_async.patch_user_frontend_data(
+        db, user_id=principal.token_data.user_id, apply_patch=checked_patch, expected_version=etag.parse_if_match(if_match)
+    )
+    if patched is None:
+        raise precondition_failed
+    data, new_version = patched
+    response.headers["ETag"] = etag.version_etag(new_version)
+    return models.CookiesData(data=data)
+
+
 @router.get("", response_model=models.CookiesData)
 async def get_frontend_data(
-    db: Session = Depends(get_db),
-    current_user: db_models.User = Depends(auth_handler.get_current_active_user) # Require logged-in user
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+    principal: auth_handler.Principal = Depends(auth_handler.require_principal) # Require logged-in user
+):
+    """
+    Retrieves the stored JSON data for the logged-in user. Send the last ETag as
+    If-None-Match to get an empty 304 when nothing changed.
+    """
+    user_id = principal.token_data.user_id
+    headers = {"Cache-Control": etag.CACHE_CONTROL}
+    # Fast path: answer from the cached version stamp without reading the data
+    cached_version = user_cache.frontend_data_version_cache.get(user_id)
+    if cached_version is not None and etag.if_none_match_satisfied(if_none_match, etag.version_etag(cached_version)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={**headers, "ETag": etag.version_etag(cached_version)})
+
+    data, version = await crud_async.get_user_frontend_data_with_version(db, user_id)
+    user_cache.frontend_data_version_cache.set(user_id, version)
+    headers["ETag"] = etag.version_etag(version)
+    if etag.if_none_match_satisfied(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return models.CookiesData(data=data) # Return stored data or empty dict
+
+
+@router.get("/{key}", response_model=models.CookieValue)
+async def get_frontend_data_value(
+    key: str,
+    db: AsyncSession = Depends(get_async_db),
+    principal: auth_handler.Principal = Depends(auth_handler.require_principal) # Require logged-in user
 ):
-    """ Retrieves the stored JSON data for the logged-in user """
-    data = crud.get_user_frontend_data(db, user_id=current_user.id)
-    return models.CookiesData(data=data or {}) # Return stored data or empty dict
\ No newline at end of file
+    """ Retrieves a single top-level key of the stored data """
+    found, value = await crud_async.get_user_frontend_data_value(db, user_id=principal.token_data.user_id, key=key)
+    if not found:
+        raise HTTPException(status_code=404, detail="Key not found")
+    return models.CookieValue(key=key, value=value)
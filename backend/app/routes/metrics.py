@@ -0,0 +1,70 @@
+import hmac
+import ipaddress
+from functools import lru_cache
+from typing import Tuple
+
+from fastapi import APIRouter, HTTPException, Request, Response, status
+
+from .. import database, metrics, rate_limit
+from ..auth import crypto, jwt_backend, user_cache
+from ..config import settings
+
+router = APIRouter()
+
+# --- Gauges, read at scrape time ---
+
+def _password_pool_jobs():
+    stats = crypto.password_pool_stats()
+    return {("queued",): stats["queue_depth"], ("in_flight",): stats["in_flight"]}
+
+def _db_pool_connections():
+    values = {}
+    for label, db_engine in (("sync", database.engine), ("async", database.async_engine.sync_engine)):
+        stats = database.pool_stats(db_engine)
+        for state in ("size", "checked_in", "checked_out", "overflow"):
+            if state in stats:
+                values[(label, state)] = stats[state]
+    return values
+
+def _cache_entries():
+    return {
+        ("user_status",): len(user_cache.user_status_cache),
+        ("profile_etag",): len(user_cache.profile_etag_cache),
+        ("frontend_data_version",): len(user_cache.frontend_data_version_cache),
+        ("jwt_verified",): len(jwt_backend.verified_claims_cache),
+    }
+
+metrics.gauge("password_hash_pool_jobs", "Password hashing jobs waiting for or holding a pool slot", ("state",), _password_pool_jobs)
+metrics.gauge("db_pool_connections", "Database connection pool usage", ("engine", "state"), _db_pool_connections)
+metrics.gauge("cache_entries", "Entries in the in-process caches", ("cache",), _cache_entries)
+
+
+# --- Scrape access ---
+
+@lru_cache(maxsize=8)
+def _allowed_networks(allowed_ips: Tuple[str, ...]):
+    return [ipaddress.ip_network(entry, strict=False) for entry in allowed_ips]
+
+def scrape_allowed(request: Request) -> bool:
+    """ True if the request carries metrics_bearer_token or comes from metrics_allowed_ips. """
+    if settings.metrics_bearer_token:
+        scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(credentials.encode(), settings.metrics_bearer_token.encode()):
+            return True
+    if settings.metrics_allowed_ips:
+        try:
+            ip = ipaddress.ip_address(rate_limit.client_ip(request))
+        except ValueError: # E.g. "unknown" or a garbage forwarded hop
+            return False
+        return any(ip in network for network in _allowed_networks(tuple(settings.metrics_allowed_ips)))
+    return False
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """ Prometheus text exposition of this worker's metrics """
+    if not settings.metrics_enabled or not (settings.metrics_bearer_token or settings.metrics_allowed_ips):
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not scrape_allowed(request):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
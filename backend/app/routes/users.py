@@ -1,10 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Security
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status, Security, Query, Request, Response, Header
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import IO, Iterator, List, Literal, Optional
+import base64
+import json
+import tempfile
 
-from .. import crud, models, db_models
-from ..database import get_db
-from ..auth import auth_handler
+from .. import bulk_io, crud_async, models, db_models
+from ..database import get_async_db, AsyncSessionLocal
+from ..auth import auth_handler, crypto
+from ..config import settings
 
 router = APIRouter()
 
@@ -12,12 +18,12 @@ router = APIRouter()
 
 # Use the specific admin dependency here
 @router.post("", response_model=models.UserPublic, status_code=status.HTTP_201_CREATED)
-def create_new_user(
+async def create_new_user(
     user: models.UserCreate, # Use the one requiring password
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     admin_user: db_models.User = Depends(auth_handler.require_admin_scope) # Check admin scope
 ):
-    db_user = crud.get_user_by_email(db, email=user.email)
+    db_user = await crud_async.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     # Convert UserCreate to UserCreateInternal for the CRUD function
@@ -29,40 +35,294 @@ def create_new_user(
         is_active=user.is_active,
         is_google_user=False # Manually created user
     )
-    return crud.create_user(db=db, user=user_internal)
+    return await crud_async.create_user(db=db, user=user_internal)
+
+
+# --- Bulk import ---
+
+IMPORT_CSV_COLUMNS = ("email", "name", "password", "password_hash", "scopes", "is_active")
+
+def _import_row(fields: dict) -> models.UserImportRow:
+    if isinstance(fields.get("scopes"), str): # CSV cells (and lenient NDJSON) list scopes space-separated
+        fields = {**fields, "scopes": fields["scopes"].split()}
+    user = models.UserImportRow.model_validate(fields)
+    if user.password_hash is not None and not crypto.is_supported_hash(user.password_hash):
+        raise ValueError("Unsupported password_hash format")
+    user.scopes = user.scopes or ["default"] # Same default as POST /users
+    return user
+
+def _validation_message(e: Exception) -> str:
+    if isinstance(e, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" if error["loc"] else error["msg"]
+            for error in e.errors()
+        )
+    return str(e)
+
+async def _run_import(db: AsyncSession, records, out: IO[bytes]) -> dict:
+    """ Imports records batch by batch, writing one result line per record to `out` in input order. """
+    counts = {"created": 0, "exists": 0, "duplicate": 0, "invalid": 0}
+    seen = set() # Emails earlier in this upload
+    pending: List[models.UserImportResult] = [] # Results held back until their batch is inserted
+    batch: List[models.UserImportRow] = []
+
+    async def flush() -> None:
+        if batch:
+            ids = await crud_async.import_users(db, batch)
+            for result in pending:
+                if result.status == "created":
+                    result.id = ids[result.email]
+                    if result.id is None:
+                        result.status = "exists"
+        for result in pending:
+            counts[result.status] += 1
+            out.write(result.model_dump_json(exclude_none=True).encode() + b"\n")
+        pending.clear()
+        batch.clear()
+
+    row = 0
+    async for fields, error in records:
+        row += 1
+        if error is None:
+            try:
+                user = _import_row(fields)
+            except ValueError as e: # Includes pydantic's ValidationError
+                error = _validation_message(e)
+        if error is not None:
+            pending.append(models.UserImportResult(row=row, status="invalid", email=(fields or {}).get("email"), error=error))
+        elif user.email in seen:
+            pending.append(models.UserImportResult(row=row, status="duplicate", email=user.email))
+        else:
+            seen.add(user.email)
+            batch.append(user)
+            pending.append(models.UserImportResult(row=row, status="created", email=user.email)) # Settled by flush
+            if len(batch) >= settings.user_import_batch_size:
+                await flush()
+    await flush()
+    return counts
+
+def _read_and_close(f: IO[bytes]) -> Iterator[bytes]:
+    try:
+        while chunk := f.read(64 * 1024):
+            yield chunk
+    finally:
+        f.close()
+
+@router.post(
+    "/import",
+    response_class=StreamingResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/x-ndjson": {"schema": {"type": "string", "description": "One UserImportRow JSON object per line"}},
+        "text/csv": {"schema": {"type": "string", "description": f"Header row with: {', '.join(IMPORT_CSV_COLUMNS)}"}},
+    }}},
+)
+async def import_users(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    admin_user: db_models.User = Depends(auth_handler.require_admin_scope) # Check admin scope
+):
+    """
+    Creates many users from an NDJSON or CSV upload (each row: email, name, scopes,
+    is_active, and a password or an existing password_hash), optionally sent with
+    Content-Encoding: gzip. The body is parsed as it streams in and imported in batches
+    of user_import_batch_size: one duplicate check, parallel password hashing and one
+    insert transaction per batch.
+
+    Responds with NDJSON: a UserImportResult per row in input order, then a
+    {"summary": {...}} line with counts per status. Batches are committed as they go,
+    so re-sending an upload after a failure reports the rows already imported as "exists".
+    """
+    content_encoding = request.headers.get("content-encoding", "identity").strip().lower()
+    if content_encoding in ("gzip", "x-gzip"):
+        body = bulk_io.gunzip_chunks(request.stream())
+    elif content_encoding in ("", "identity"):
+        body = request.stream()
+    else:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Content-Encoding must be gzip or identity")
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in bulk_io.NDJSON_MEDIA_TYPES:
+        records = bulk_io.read_ndjson(body)
+    elif content_type == bulk_io.CSV_MEDIA_TYPE:
+        records = bulk_io.read_csv(body, IMPORT_CSV_COLUMNS)
+    else:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Send application/x-ndjson or text/csv")
+
+    # Results are spooled and sent once the upload is consumed: answering while the client is
+    # still sending can deadlock clients that only read the response after the request body.
+    out = tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+    try:
+        counts = await _run_import(db, records, out)
+    except bulk_io.BulkFormatError as e:
+        out.close()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except BaseException:
+        out.close()
+        raise
+    out.write(json.dumps({"summary": counts}).encode() + b"\n")
+    out.seek(0)
+    return StreamingResponse(_read_and_close(out), media_type="application/x-ndjson")
+
+
+def encode_cursor(last_id: int) -> str:
+    """ Opaque pagination cursor; clients should pass it back verbatim. """
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @router.get("", response_model=List[models.UserPublic])
-def read_all_users(
-    skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db),
+async def read_all_users(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    is_active: Optional[bool] = None,
+    is_google_user: Optional[bool] = None,
+    email_prefix: Optional[str] = None,
+    scope: Optional[str] = None,
+    skip: int = Query(0, ge=0, deprecated=True), # Offset paging, kept for older clients
+    db: AsyncSession = Depends(get_async_db),
     admin_user: db_models.User = Depends(auth_handler.require_admin_scope) # Check admin scope
 ):
-    users = crud.get_users(db, skip=skip, limit=limit)
+    """
+    Lists users ordered by id. When more pages exist, the X-Next-Cursor response
+    header holds the cursor for the next one.
+    """
+    filters = models.UserFilter(
+        is_active=is_active, is_google_user=is_google_user, email_prefix=email_prefix, scope=scope
+    )
+    if cursor is None and skip:
+        users = await crud_async.get_users(db, skip=skip, limit=limit, filters=filters)
+    else:
+        after_id = decode_cursor(cursor) if cursor else None
+        users = await crud_async.get_users_page(db, limit=limit, after_id=after_id, filters=filters)
+    if len(users) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(users[-1].id)
     return users
 
 
+@router.get("/export", response_class=StreamingResponse)
+async def export_users(
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    is_active: Optional[bool] = None,
+    is_google_user: Optional[bool] = None,
+    email_prefix: Optional[str] = None,
+    scope: Optional[str] = None,
+    accept_encoding: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db), # The session the auth dependencies used (cached per request)
+    admin_user: db_models.User = Depends(auth_handler.require_admin_scope) # Check admin scope
+):
+    """
+    Streams all users (optionally filtered like the listing) as NDJSON or CSV, gzipped
+    when the client sends Accept-Encoding: gzip. Rows are read in keyset chunks of
+    user_export_chunk_size, each in its own short transaction, and serialized straight
+    from row tuples, so memory stays flat however large the table is.
+    """
+    filters = models.UserFilter(
+        is_active=is_active, is_google_user=is_google_user, email_prefix=email_prefix, scope=scope
+    )
+    columns = crud_async.USER_EXPORT_COLUMNS
+
+    async def chunks():
+        after_id = None
+        if format == "csv":
+            yield bulk_io.csv_lines([], header=columns)
+        while True:
+            # A fresh session per chunk: the connection is back in the pool while the client reads
+            async with AsyncSessionLocal() as db:
+                rows = await crud_async.get_user_export_rows(
+                    db, limit=settings.user_export_chunk_size, after_id=after_id, filters=filters
+                )
+            if not rows:
+                return
+            yield bulk_io.csv_lines(rows) if format == "csv" else bulk_io.ndjson_lines(columns, rows)
+            if len(rows) < settings.user_export_chunk_size:
+                return
+            after_id = rows[-1].id
+
+    # The auth lookup is done; release its connection now rather than when the response
+    # finishes, so a slow download doesn't hold it (and its transaction) open throughout
+    await db.close()
+
+    media_type = bulk_io.CSV_MEDIA_TYPE if format == "csv" else bulk_io.NDJSON_MEDIA_TYPES[0]
+    headers = {"Content-Disposition": f'attachment; filename="users.{format}"', "Vary": "Accept-Encoding"}
+    body = chunks()
+    if bulk_io.accepts_gzip(accept_encoding):
+        body = bulk_io.gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
+@router.post("/scopes/grant", response_model=models.BulkUpdateResult)
+async def grant_scope_to_users(
+    change: models.ScopeBulkChange,
+    db: AsyncSession = Depends(get_async_db),
+    admin_user: db_models.User = Depends(auth_handler.require_admin_scope) # Check admin scope
+):
+    """ Adds a scope to many users at once. Returns how many users actually changed. """
+    affected = await crud_async.grant_scope(db, scope=change.scope, user_ids=change.user_ids)
+    return models.BulkUpdateResult(affected=affected)
+
+
+@router.post("/scopes/revoke", response_model=models.BulkUpdateResult)
+async def revoke_scope_from_users(
+    change: models.ScopeBulkChange,
+    db: AsyncSession = Depends(get_async_db),
+    admin_user: db_models.User = Depends(auth_handler.require_admin_scope) # Check admin scope
+):
+    """ Removes a scope from many users at once. Returns how many users actually changed. """
+    if change.scope == "admin" and admin_user.id in change.user_ids:
+        raise HTTPException(status_code=403, detail="Cannot remove own admin scope")
+    affected = await crud_async.revoke_scope(db, scope=change.scope, user_ids=change.user_ids)
+    return models.BulkUpdateResult(affected=affected)
+
+
+@router.post("/batch", response_model=models.UserBatchUpdateResult)
+async def batch_update_users(
+    batch: models.UserBatchUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    admin_user: db_models.User = Depends(auth_handler.require_admin_scope) # Check admin scope
+):
+    """
+    Adds/removes scopes and sets is_active for many users in one transaction, selected by
+    `user_ids` or by `filter` (same fields as the listing filters). Returns affected counts.
+    """
+    user_ids = await crud_async.resolve_user_ids(db, user_ids=batch.user_ids, filters=batch.filter)
+    if admin_user.id in set(user_ids):
+        if "admin" in batch.remove_scopes:
+            raise HTTPException(status_code=403, detail="Cannot remove own admin scope")
+        if batch.is_active is False:
+            raise HTTPException(status_code=403, detail="Admin users cannot deactivate themselves.")
+    return await crud_async.batch_update_users(
+        db, user_ids, add_scopes=batch.add_scopes, remove_scopes=batch.remove_scopes, is_active=batch.is_active
+    )
+
+
 @router.get("/{user_id}", response_model=models.UserPublic)
-def read_single_user(
+async def read_single_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     admin_user: db_models.User = Depends(auth_handler.require_admin_scope) # Check admin scope
 ):
-    db_user = crud.get_user(db, user_id=user_id)
+    db_user = await crud_async.get_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 
 @router.put("/{user_id}", response_model=models.UserPublic)
-def update_existing_user(
+async def update_existing_user(
     user_id: int,
     user_update: models.UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     admin_user: db_models.User = Depends(auth_handler.require_admin_scope) # Check admin scope
 ):
-    db_user = crud.update_user(db=db, user_id=user_id, user_update=user_update)
+    db_user = await crud_async.update_user(db=db, user_id=user_id, user_update=user_update)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     # Prevent admin from accidentally removing their own admin scope? Optional check.
@@ -72,16 +332,16 @@ def update_existing_user(
 
 
 @router.delete("/{user_id}", response_model=models.UserPublic)
-def delete_existing_user(
+async def delete_existing_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     admin_user: db_models.User = Depends(auth_handler.require_admin_scope) # Check admin scope
 ):
     # Prevent admin from deleting themselves?
     if admin_user.id == user_id:
          raise HTTPException(status_code=403, detail="Admin users cannot delete themselves.")
 
-    db_user = crud.delete_user(db=db, user_id=user_id)
+    db_user = await crud_async.delete_user(db=db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
\ No newline at end of file
@@ -0,0 +1,20 @@
+from typing import Optional
+from fastapi import APIRouter, Header, Response, status
+
+from .. import etag
+from ..auth import signing_keys
+from ..config import settings
+
+router = APIRouter()
+
+@router.get("/.well-known/jwks.json", tags=["Authentication"])
+async def jwks(if_none_match: Optional[str] = Header(None)):
+    """
+    Public keys for verifying access tokens (RS*/ES* algorithms only). Downstream
+    services can cache this for max-age and refetch when they see an unknown kid.
+    """
+    document, jwks_etag = signing_keys.get_jwks_document()
+    headers = {"Cache-Control": f"public, max-age={settings.jwks_max_age_seconds}", "ETag": jwks_etag}
+    if etag.if_none_match_satisfied(if_none_match, jwks_etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=document, media_type="application/json", headers=headers)
@@ -0,0 +1,74 @@
+"""
+Micro-benchmark of the JWT backends in app/auth/jwt_backend.py.
+
+Run from the backend directory:
+
+    python benchmarks/jwt_backends.py [--iterations 20000] [--algorithm HS256]
+
+Reports encode, decode (full verification) and decode through the verified-token
+cache for every backend that can be imported here.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.auth import jwt_backend, signing_keys
+from app.config import settings
+
+
+def _time_per_op(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6 # microseconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--algorithm", default="HS256", help="HS256/384/512, RS256 or ES256")
+    args = parser.parse_args()
+
+    settings.algorithm = args.algorithm
+    if signing_keys.is_asymmetric():
+        signing_keys.init_signing_keys()
+        active = signing_keys.get_active_key()
+        sign_key, verify_key, headers = active.private_key, active.public_key, {"kid": active.kid}
+    else:
+        sign_key = verify_key = settings.secret_key
+        headers = None
+    claims = {
+        "sub": "12345",
+        "scopes": ["read:profile", "manage:users"],
+        "ver": 3,
+        "exp": datetime.now(timezone.utc) + timedelta(minutes=30),
+    }
+
+    print(f"{args.algorithm}, {args.iterations} iterations (microseconds per operation)")
+    print(f"{'backend':<8} {'encode':>10} {'decode':>10} {'cached':>10}")
+    for name, backend_class in jwt_backend._BACKENDS.items():
+        try:
+            backend = backend_class()
+        except ImportError:
+            print(f"{name:<8} (not installed)")
+            continue
+        token = backend.encode(claims, sign_key, args.algorithm, headers)
+        backend.decode(token, verify_key, [args.algorithm]) # Warm up key preparation
+
+        def decode_cached():
+            if jwt_backend.get_verified_claims(token) is None:
+                jwt_backend.remember_verified_claims(token, backend.decode(token, verify_key, [args.algorithm]))
+
+        jwt_backend.verified_claims_cache.clear()
+        encode_us = _time_per_op(lambda: backend.encode(claims, sign_key, args.algorithm, headers), args.iterations)
+        decode_us = _time_per_op(lambda: backend.decode(token, verify_key, [args.algorithm]), args.iterations)
+        cached_us = _time_per_op(decode_cached, args.iterations)
+        print(f"{name:<8} {encode_us:>10.2f} {decode_us:>10.2f} {cached_us:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+In-process load test of the hot endpoints: drives main.app_obj through
+httpx.ASGITransport (no sockets, no server) against a seeded throwaway SQLite
+database, with Google OAuth answered by an httpx.MockTransport stand-in.
+
+Run from the backend directory:
+
+    python benchmarks/load_test.py [--users 1000,10000] [--concurrency 1,16] [--requests 500]
+        [--scenarios login,me,...] [--output results.json] [--baseline previous.json]
+
+Every scenario runs for each (user-table size, concurrency) pair and reports
+requests/sec and p50/p95/p99 latency. --output writes the results as JSON along
+with the commit and the settings that shape them (JWT backend, hash scheme, ...);
+--baseline prints the change in p50/p95 and requests/sec against such a file.
+
+Rate limiting is disabled. Other settings come from the environment as usual,
+e.g. PASSWORD_BCRYPT_ROUNDS=10 or JWT_BACKEND=jose. Login runs --login-requests
+(fewer, since each one is a full bcrypt verify).
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp_dir}/bench.db"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ.update(
+    GOOGLE_CLIENT_ID="bench-client",
+    GOOGLE_CLIENT_SECRET="bench-secret",
+    GOOGLE_REDIRECT_URI="http://bench/api/v1/auth/google/callback",
+    GOOGLE_DISCOVERY_URL="http://google.bench/.well-known/openid-configuration",
+)
+
+import httpx
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+from sqlalchemy import func, select
+
+from app import db_models, database, http_client
+from app.auth import auth_handler, crypto
+from app.config import settings
+
+PASSWORD = "bench-password"
+SCENARIOS = ("login", "me", "cookies_get", "cookies_patch", "users_list", "google_callback")
+
+
+# --- Google stand-in ---
+
+class FakeGoogle:
+    """ Discovery, JWKS and token endpoints, answering with one pre-signed id_token. """
+    issuer = "http://google.bench"
+
+    def __init__(self):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        pem = private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        self.public_jwk = {**jwk.construct(pem, "RS256").public_key().to_dict(), "kid": "bench", "alg": "RS256"}
+        now = int(time.time())
+        self.id_token = jwt.encode(
+            {"iss": self.issuer, "aud": settings.google_client_id, "sub": "bench-google-user",
+             "email": "google-user@example.com", "name": "Google User", "iat": now, "exp": now + 86400},
+            pem, algorithm="RS256", headers={"kid": "bench"},
+        )
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path.endswith("/openid-configuration"):
+            return httpx.Response(200, json={
+                "issuer": self.issuer,
+                "authorization_endpoint": f"{self.issuer}/auth",
+                "token_endpoint": f"{self.issuer}/token",
+                "userinfo_endpoint": f"{self.issuer}/userinfo",
+                "jwks_uri": f"{self.issuer}/jwks",
+            })
+        if path == "/jwks":
+            return httpx.Response(200, json={"keys": [self.public_jwk]})
+        if path == "/token":
+            return httpx.Response(200, json={"access_token": "bench-access", "token_type": "Bearer", "id_token": self.id_token})
+        return httpx.Response(404)
+
+
+# --- Data ---
+
+def seed_users(total: int, password_hash: str) -> None:
+    """ Grows the users table to `total` rows (bulk inserts, bypassing crud). """
+    User = db_models.User
+    with database.engine.begin() as connection:
+        start = connection.scalar(select(func.count(User.id)))
+        for batch_start in range(start, total, 10000):
+            batch = range(batch_start, min(total, batch_start + 10000))
+            user_ids = connection.execute(User.__table__.insert().returning(User.id), [
+                {"email": f"user{i}@example.com", "name": f"User {i}", "hashed_password": password_hash,
+                 "scopes": ["read:profile"], "is_active": True, "is_google_user": False, "token_version": 0}
+                for i in batch
+            ]).scalars().all()
+            connection.execute(db_models.UserScope.__table__.insert(), [
+                {"user_id": user_id, "scope": "read:profile"} for user_id in user_ids
+            ])
+            connection.execute(db_models.UserFrontendData.__table__.insert(), [
+                {"user_id": user_id, "data": {"theme": "dark", "recent": list(range(10))}, "version": 0}
+                for user_id in user_ids
+            ])
+
+def access_tokens(count: int) -> List[str]:
+    """ Tokens for a random sample of users (minted directly; logins are benchmarked separately). """
+    with database.SessionLocal() as db:
+        users = db.scalars(
+            select(db_models.User).where(db_models.User.is_google_user.is_(False)).order_by(func.random()).limit(count)
+        ).all()
+        return [auth_handler.create_access_token_for_user(user) for user in users]
+
+
+# --- Scenarios: each builds a request from the request number ---
+
+def make_scenarios(users: int, tokens: List[str], admin_token: str) -> Dict[str, Callable[[int], Dict[str, Any]]]:
+    def bearer(i: int) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+
+    return {
+        "login": lambda i: dict(method="POST", url="/api/v1/auth/login", data={
+            "username": f"user{random.randrange(users)}@example.com", "password": PASSWORD,
+        }),
+        "me": lambda i: dict(method="GET", url="/api/v1/auth/me", headers=bearer(i)),
+        "cookies_get": lambda i: dict(method="GET", url="/api/v1/cookies", headers=bearer(i)),
+        "cookies_patch": lambda i: dict(
+            method="PATCH", url="/api/v1/cookies", content=json.dumps({"last_seen": i}),
+            headers={**bearer(i), "Content-Type": "application/merge-patch+json"},
+        ),
+        "users_list": lambda i: dict(
+            method="GET", url="/api/v1/users", params={"limit": 50}, headers={"Authorization": f"Bearer {admin_token}"},
+        ),
+        "google_callback": lambda i: dict(method="GET", url="/api/v1/auth/google/callback", params={"code": f"code-{i}"}),
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, build: Callable[[int], Dict[str, Any]], requests: int, concurrency: int, warmup: int) -> Dict[str, Any]:
+    # Route handlers print (e.g. the Google callback); keep that out of the output and the timings
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(warmup):
+            await client.request(**build(i))
+        return await _measure(client, build, requests, concurrency)
+
+async def _measure(client: httpx.AsyncClient, build: Callable[[int], Dict[str, Any]], requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    next_request = 0
+
+    async def worker() -> None:
+        nonlocal next_request, errors
+        while next_request < requests:
+            i = next_request
+            next_request += 1
+            started = time.perf_counter()
+            response = await client.request(**build(i))
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / wall, 1),
+        "cpu_ms_per_request": round(cpu / len(latencies) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": round(percentiles[49] * 1000, 3),
+        "p95_ms": round(percentiles[94] * 1000, 3),
+        "p99_ms": round(percentiles[98] * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _metadata(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": {"users": args.users, "concurrency": args.concurrency, "requests": args.requests,
+                 "login_requests": args.login_requests, "warmup": args.warmup},
+        "settings": {name: getattr(settings, name) for name in (
+            "algorithm", "jwt_backend", "token_validation_mode", "password_hash_scheme", "password_bcrypt_rounds",
+            "password_hash_executor", "password_hash_workers", "email_filter_enabled", "metrics_enabled",
+        )},
+    }
+
+def _result_key(result: Dict[str, Any]):
+    return (result["scenario"], result["users"], result["concurrency"])
+
+def _print_row(result: Dict[str, Any], baseline: Dict[tuple, Dict[str, Any]]) -> None:
+    line = (f"{result['scenario']:<16} {result['users']:>8} {result['concurrency']:>5} {result['rps']:>9.1f} "
+            f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['errors']:>6}")
+    before = baseline.get(_result_key(result))
+    if before:
+        change = lambda field: (result[field] - before[field]) / before[field] * 100 if before[field] else 0.0
+        line += f"   rps {change('rps'):+.0f}%  p50 {change('p50_ms'):+.0f}%  p95 {change('p95_ms'):+.0f}%"
+    print(line, flush=True)
+
+
+async def run(args: argparse.Namespace, baseline: Dict[tuple, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    import main as app_main
+
+    google = FakeGoogle()
+    password_hash = crypto.get_password_hash(PASSWORD) # One hash shared by all seeded users
+    results = []
+    print(f"{'scenario':<16} {'users':>8} {'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>6}")
+    for users in args.users:
+        seed_users(users, password_hash)
+        # Startup (admin user, known-email filter, keys) runs per table size, as on a fresh deploy
+        with contextlib.redirect_stdout(io.StringIO()):
+            lifespan = app_main.lifespan(app_main.app_obj)
+            await lifespan.__aenter__()
+        try:
+            await http_client.init_http_client(httpx.MockTransport(google.handler))
+            with database.SessionLocal() as db:
+                admin = db.scalar(select(db_models.User).where(db_models.User.email == settings.admin_email))
+                admin_token = auth_handler.create_access_token_for_user(admin)
+            scenarios = make_scenarios(users, access_tokens(min(users, 1000)), admin_token)
+            transport = httpx.ASGITransport(app=app_main.app_obj)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                for concurrency in args.concurrency:
+                    for name in args.scenarios:
+                        requests = args.login_requests if name == "login" else args.requests
+                        result = {"scenario": name, "users": users, "concurrency": concurrency}
+                        result.update(await run_scenario(client, scenarios[name], requests, concurrency, args.warmup))
+                        _print_row(result, baseline)
+                        results.append(result)
+        finally:
+            with contextlib.redirect_stdout(io.StringIO()):
+                await lifespan.__aexit__(None, None, None)
+    return results
+
+
+def _int_list(value: str) -> List[int]:
+    return sorted(int(item) for item in value.split(",") if item.strip())
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=_int_list, default=[1000, 10000], help="Comma-separated user-table sizes")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 16], help="Comma-separated in-flight request counts")
+    parser.add_argument("--requests", type=int, default=500, help="Measured requests per scenario")
+    parser.add_argument("--login-requests", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests before each scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the request mix")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    random.seed(args.seed)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {_result_key(result): result for result in json.load(f)["results"]}
+
+    db_models.Base.metadata.create_all(database.engine)
+    metadata = _metadata(args)
+    results = asyncio.run(run(args, baseline))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"metadata": metadata, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Cost profile of failed logins: known email with a wrong password (bcrypt runs)
+versus unknown emails (rejected via the known-email filter, padded, no bcrypt).
+
+Run from the backend directory:
+
+    python benchmarks/login_cost.py [--requests 50] [--users 1000]
+
+Uses a throwaway SQLite database with rate limiting disabled. CPU time is the
+whole process (event loop plus the bcrypt pool).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp_dir}/bench.db"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+from fastapi.testclient import TestClient
+
+from app import db_models, database
+from app.config import settings
+
+
+def _measure(client: TestClient, emails, password: str):
+    wall, cpu = time.perf_counter(), time.process_time()
+    for email in emails:
+        assert client.post("/api/v1/auth/login", data={"username": email, "password": password}).status_code == 401
+    count = len(emails)
+    return (time.perf_counter() - wall) / count * 1000, (time.process_time() - cpu) / count * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    db_models.Base.metadata.create_all(database.engine)
+    with database.engine.begin() as connection: # Bulk rows; password hashes aren't needed for misses
+        connection.execute(db_models.User.__table__.insert(), [
+            {"email": f"user{i}@example.com", "scopes": [], "is_active": True, "is_google_user": False, "token_version": 0}
+            for i in range(args.users)
+        ])
+
+    import main as app_main
+    with TestClient(app_main.app_obj) as client:
+        known = [settings.admin_email] * args.requests
+        unknown = [f"nobody{i}@example.com" for i in range(args.requests)]
+        print(f"{args.requests} failed logins each, {args.users + 1} users (milliseconds per request)")
+        print(f"{'case':<32} {'wall':>8} {'cpu':>8}")
+        for label, emails in (("known email, wrong password", known), ("unknown email (filter)", unknown)):
+            wall_ms, cpu_ms = _measure(client, emails, "wrong-password")
+            print(f"{label:<32} {wall_ms:>8.1f} {cpu_ms:>8.1f}")
+        settings.email_filter_enabled = False
+        wall_ms, cpu_ms = _measure(client, [f"other{i}@example.com" for i in range(args.requests)], "wrong-password")
+        print(f"{'unknown email (no filter)':<32} {wall_ms:>8.1f} {cpu_ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
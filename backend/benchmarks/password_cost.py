@@ -0,0 +1,70 @@
+"""
+Picks a password-hash cost for a target verify latency on this machine.
+
+Run from the backend directory:
+
+    python benchmarks/password_cost.py --target-ms 250 [--scheme bcrypt|argon2] [--memory-kib 65536] [--parallelism 4]
+
+bcrypt: tries increasing rounds. argon2: keeps memory/parallelism fixed and tries
+increasing time_cost. Prints each measurement and the settings to use: the highest
+cost whose median verify time stays within the target.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.auth.crypto import build_context
+
+
+def _median_verify_ms(context, samples: int) -> float:
+    hashed = context.hash("benchmark-password")
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.verify("benchmark-password", hashed)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target-ms", type=float, default=250.0, help="Verify latency budget per login")
+    parser.add_argument("--scheme", choices=["bcrypt", "argon2"], default="bcrypt")
+    parser.add_argument("--memory-kib", type=int, default=64 * 1024, help="argon2 memory cost")
+    parser.add_argument("--parallelism", type=int, default=4, help="argon2 lanes")
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.scheme == "bcrypt":
+        costs, cost_setting = range(8, 20), "PASSWORD_BCRYPT_ROUNDS"
+        make_context = lambda cost: build_context(scheme="bcrypt", bcrypt_rounds=cost)
+    else:
+        costs, cost_setting = range(1, 33), "PASSWORD_ARGON2_TIME_COST"
+        make_context = lambda cost: build_context(
+            scheme="argon2", argon2_time_cost=cost, argon2_memory_cost_kib=args.memory_kib, argon2_parallelism=args.parallelism
+        )
+
+    chosen = None
+    for cost in costs:
+        verify_ms = _median_verify_ms(make_context(cost), args.samples)
+        print(f"{args.scheme} cost {cost:>2}: {verify_ms:8.1f} ms")
+        if verify_ms > args.target_ms:
+            break
+        chosen = cost
+
+    if chosen is None:
+        print(f"Even the lowest cost exceeds {args.target_ms:.0f} ms on this machine.")
+        return
+    print(f"\nPASSWORD_HASH_SCHEME={args.scheme}")
+    print(f"{cost_setting}={chosen}")
+    if args.scheme == "argon2":
+        print(f"PASSWORD_ARGON2_MEMORY_COST_KIB={args.memory_kib}")
+        print(f"PASSWORD_ARGON2_PARALLELISM={args.parallelism}")
+
+
+if __name__ == "__main__":
+    main()
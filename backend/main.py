@@ -5,10 +5,12 @@ import uvicorn, contextlib
 import asyncio  # Import asyncio
 
 from app.api import api_router
-from app.database import engine, Base, SessionLocal, get_db
+from app.database import engine, Base, SessionLocal, get_db, async_engine
 from app.db_models import User  # Import User model
-from app import crud, models, config
-from app.auth import crypto
+from app import crud, models, config, http_client
+from app.auth import crypto, email_filter, jwt_backend, signing_keys
+from app.routes import well_known, metrics as metrics_routes
+from app.metrics import MetricsMiddleware
 from app.config import settings  # Import settings instance
 
 # Create database tables if they don't exist
@@ -60,14 +62,33 @@ def create_initial_admin():
         db.close()
 
 
+def prepare_login():
+    # Known-email filter and bcrypt timing for padding failed logins
+    db: Session = SessionLocal()
+    try:
+        email_filter.build(db)
+    finally:
+        db.close()
+    crypto.calibrate_verify_time()
+
+
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Starting up...")
     # Run the synchronous function in a separate thread using asyncio.to_thread
     await asyncio.to_thread(create_initial_admin)
+    await asyncio.to_thread(prepare_login)
+    await asyncio.to_thread(signing_keys.init_signing_keys)
+    jwt_backend.init_jwt_backend()
+    await http_client.init_http_client()
+    if settings.metrics_enabled and not (settings.metrics_bearer_token or settings.metrics_allowed_ips):
+        print("Warning: /metrics is not served until METRICS_BEARER_TOKEN or METRICS_ALLOWED_IPS is set.")
     print("Startup complete.")
     yield
     print("Shutting down...")
+    await http_client.close_http_client()
+    crypto.shutdown_password_pool()
+    await async_engine.dispose()
 
 # Create the FastAPI app instance, passing the lifespan function
 app_obj = FastAPI(
@@ -85,10 +106,16 @@ app_obj.add_middleware(
     allow_credentials=True,  # Important for cookies/auth headers
     allow_methods=["*"],  # Allow all methods (GET, POST, etc.)
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["X-Next-Cursor", "ETag", "Retry-After"],  # Let browsers read pagination/versioning/throttling headers
 )
 
+if settings.metrics_enabled:
+    app_obj.add_middleware(MetricsMiddleware) # Outermost, so latency includes CORS handling
+
 # Include the API router
 app_obj.include_router(api_router)
+app_obj.include_router(well_known.router) # /.well-known/jwks.json lives at the root, not under /api/v1
+app_obj.include_router(metrics_routes.router) # /metrics, where Prometheus expects it
 
 
 # Root endpoint (optional)
@@ -0,0 +1,54 @@
+"""
+Shared fixtures. The app runs against a throwaway SQLite database; its URL has to be
+in the environment before any app module is imported, since the engines and settings
+are created at import time.
+"""
+import os
+import tempfile
+import uuid
+
+import pytest
+
+_db_dir = tempfile.mkdtemp(prefix="auth-service-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_dir}/test.db"
+os.environ["RATE_LIMIT_ENABLED"] = "false" # Tests log in far more often than any limit allows
+os.environ["REFRESH_COOKIE_SECURE"] = "false" # The test client talks plain http
+
+ADMIN_EMAIL = "admin@example.com"
+ADMIN_PASSWORD = "password"
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app import database, db_models
+    db_models.Base.metadata.create_all(database.engine)
+    import main
+    with TestClient(main.app_obj) as test_client: # Runs the lifespan (initial admin, caches)
+        yield test_client
+
+def _login(client, email: str, password: str):
+    client.cookies.clear() # Each login starts its own session
+    return client.post("/api/v1/auth/login", data={"username": email, "password": password})
+
+@pytest.fixture
+def login(client):
+    """ login(email, password) -> the /auth/login response """
+    return lambda email, password: _login(client, email, password)
+
+@pytest.fixture
+def admin_headers(client):
+    response = _login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.fixture
+def create_user(client, admin_headers):
+    """ create_user(**fields) -> the created user's JSON; email and password default to unique values """
+    def create(**fields):
+        fields.setdefault("email", f"user-{uuid.uuid4().hex[:12]}@example.com")
+        fields.setdefault("password", "password1")
+        response = client.post("/api/v1/users", json=fields, headers=admin_headers)
+        assert response.status_code == 201, response.text
+        return {**response.json(), "password": fields["password"]}
+    return create
@@ -0,0 +1,174 @@
+"""
+Local verification of Google id_tokens against a stubbed Google (httpx.MockTransport):
+discovery/JWKS caching, the refresh on an unknown kid, and the aud/iss/at_hash checks.
+"""
+import asyncio
+import time
+import urllib.parse
+from collections import Counter
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jose import jwk, jwt
+
+from app import http_client
+from app.auth import auth_handler, google_oidc
+from app.config import settings
+
+ISSUER = "https://accounts.google.com"
+CLIENT_ID = "client-123.apps.googleusercontent.com"
+DISCOVERY = {
+    "issuer": ISSUER,
+    "authorization_endpoint": "https://accounts.google.com/o/oauth2/v2/auth",
+    "token_endpoint": "https://oauth2.googleapis.com/token",
+    "userinfo_endpoint": "https://openidconnect.googleapis.com/v1/userinfo",
+    "jwks_uri": "https://www.googleapis.com/oauth2/v3/certs",
+}
+
+
+def _signing_key(kid: str):
+    private_pem = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public_jwk = jwk.construct(private_pem, "RS256").public_key().to_dict()
+    return private_pem, {**public_jwk, "kid": kid, "alg": "RS256", "use": "sig"}
+
+@pytest.fixture(scope="module")
+def keys():
+    return {kid: _signing_key(kid) for kid in ("k1", "k2")}
+
+
+class FakeGoogle:
+    """ Serves discovery, the JWKS (only the kids in `published`) and the token endpoint. """
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.published = ["k1"]
+        self.token_response = {}
+        self.requests = Counter()
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        self.requests[url] += 1
+        if url == settings.google_discovery_url:
+            return httpx.Response(200, json=DISCOVERY)
+        if url == DISCOVERY["jwks_uri"]:
+            return httpx.Response(200, json={"keys": [self.keys[kid][1] for kid in self.published]})
+        if url == DISCOVERY["token_endpoint"]:
+            return httpx.Response(200, json=self.token_response)
+        return httpx.Response(404)
+
+@pytest.fixture
+def google(keys, monkeypatch):
+    monkeypatch.setattr(settings, "google_client_id", CLIENT_ID)
+    monkeypatch.setattr(settings, "google_jwks_min_refresh_seconds", 60.0)
+    fake = FakeGoogle(keys)
+    saved = http_client._client
+    http_client._client = http_client.create_http_client(httpx.MockTransport(fake))
+    google_oidc.clear_cache()
+    yield fake
+    google_oidc.clear_cache()
+    http_client._client = saved
+
+def id_token(keys, kid="k1", access_token=None, **overrides) -> str:
+    now = int(time.time())
+    claims = {
+        "iss": ISSUER, "aud": CLIENT_ID, "sub": "1234567890", "email": "person@gmail.com",
+        "email_verified": True, "name": "A Person", "iat": now, "exp": now + 600,
+    }
+    claims.update(overrides)
+    return jwt.encode(claims, keys[kid][0].decode(), algorithm="RS256", headers={"kid": kid}, access_token=access_token)
+
+def verify(token: str, access_token=None):
+    return asyncio.run(google_oidc.verify_id_token(token, access_token=access_token))
+
+def rejected(token: str, access_token=None) -> bool:
+    with pytest.raises(HTTPException) as excinfo:
+        verify(token, access_token)
+    return excinfo.value.status_code == 400
+
+
+def test_valid_token(google, keys):
+    claims = verify(id_token(keys))
+    assert claims["email"] == "person@gmail.com"
+    assert claims["sub"] == "1234567890"
+
+def test_issuer_without_scheme_accepted(google, keys):
+    assert verify(id_token(keys, iss="accounts.google.com"))["email"] == "person@gmail.com"
+
+def test_discovery_and_jwks_cached(google, keys):
+    for _ in range(3):
+        verify(id_token(keys))
+    assert google.requests[settings.google_discovery_url] == 1
+    assert google.requests[DISCOVERY["jwks_uri"]] == 1
+
+def test_jwks_refetched_after_ttl(google, keys, monkeypatch):
+    verify(id_token(keys))
+    monkeypatch.setattr(settings, "google_jwks_cache_ttl_seconds", 0.0)
+    google_oidc._jwks_expires_at = 0.0 # As if the TTL had passed
+    verify(id_token(keys))
+    assert google.requests[DISCOVERY["jwks_uri"]] == 2
+
+def test_unknown_kid_refreshes_jwks_once(google, keys, monkeypatch):
+    verify(id_token(keys, kid="k1"))
+    google.published = ["k1", "k2"] # Google rotated in a new key
+    monkeypatch.setattr(settings, "google_jwks_min_refresh_seconds", 0.0)
+    assert verify(id_token(keys, kid="k2"))["email"] == "person@gmail.com"
+    assert google.requests[DISCOVERY["jwks_uri"]] == 2
+
+def test_unknown_kid_refresh_rate_limited(google, keys):
+    verify(id_token(keys, kid="k1"))
+    google.published = ["k1", "k2"]
+    assert rejected(id_token(keys, kid="k2")) # Within google_jwks_min_refresh_seconds of the last fetch
+    assert google.requests[DISCOVERY["jwks_uri"]] == 1
+
+def test_made_up_kid_rejected(google, keys, monkeypatch):
+    monkeypatch.setattr(settings, "google_jwks_min_refresh_seconds", 0.0)
+    forged = jwt.encode({"sub": "x", "aud": CLIENT_ID, "iss": ISSUER}, "secret", algorithm="HS256", headers={"kid": "nope"})
+    assert rejected(forged)
+    assert rejected("not-a-jwt")
+
+@pytest.mark.parametrize("overrides", [
+    {"aud": "someone-else.apps.googleusercontent.com"},
+    {"iss": "https://evil.example.com"},
+    {"exp": int(time.time()) - 60},
+])
+def test_bad_claims_rejected(google, keys, overrides):
+    assert rejected(id_token(keys, **overrides))
+
+def test_signature_from_unpublished_key_rejected(google, keys):
+    token = id_token(keys, kid="k2")
+    header_k1 = id_token(keys, kid="k1").split(".")[0]
+    assert rejected(".".join([header_k1] + token.split(".")[1:])) # Claims kid k1, signed by k2
+
+def test_at_hash_checked(google, keys):
+    token = id_token(keys, access_token="ya29.real-access-token")
+    assert verify(token, access_token="ya29.real-access-token")["email"] == "person@gmail.com"
+    assert rejected(token, access_token="ya29.some-other-token")
+
+
+# --- Through the OAuth callback ---
+
+def test_callback_signs_in_with_verified_id_token(client, google, keys, monkeypatch):
+    monkeypatch.setattr(settings, "google_client_secret", "client-secret")
+    monkeypatch.setattr(settings, "google_redirect_uri", "http://testserver/api/v1/auth/google/callback")
+    email = f"g-{time.time_ns()}@gmail.com"
+    google.token_response = {"access_token": "ya29.token", "id_token": id_token(keys, access_token="ya29.token", email=email)}
+
+    response = client.get("/api/v1/auth/google/callback", params={"code": "auth-code"}, follow_redirects=False)
+    assert response.status_code in (302, 307), response.text
+    fragment = urllib.parse.parse_qs(urllib.parse.urlparse(response.headers["location"]).fragment)
+    assert fragment["login_status"] == ["success"]
+    assert auth_handler._decode_token_claims(fragment["access_token"][0]).user_id > 0
+    assert google.requests[DISCOVERY["token_endpoint"]] == 1
+    assert google.requests[DISCOVERY["userinfo_endpoint"]] == 0 # Identity came from the id_token
+
+def test_callback_rejects_id_token_for_another_client(client, google, keys, monkeypatch):
+    monkeypatch.setattr(settings, "google_client_secret", "client-secret")
+    monkeypatch.setattr(settings, "google_redirect_uri", "http://testserver/api/v1/auth/google/callback")
+    google.token_response = {"access_token": "ya29.token", "id_token": id_token(keys, aud="someone-else")}
+    response = client.get("/api/v1/auth/google/callback", params={"code": "auth-code"}, follow_redirects=False)
+    assert response.status_code == 400
@@ -0,0 +1,60 @@
+"""
+The shared outbound httpx.AsyncClient: one instance, replaceable (e.g. by a MockTransport
+in tests), closed when replaced or shut down.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app import http_client
+
+
+@pytest.fixture(autouse=True)
+def restore_shared_client():
+    # The app's lifespan may have created the shared client; put it back afterwards
+    saved = http_client._client
+    http_client._client = None
+    yield
+    http_client._client = saved
+
+
+def test_requests_go_through_the_injected_transport():
+    seen = []
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append((request.method, str(request.url)))
+        return httpx.Response(200, json={"ok": True})
+
+    async def scenario():
+        client = await http_client.init_http_client(httpx.MockTransport(handler))
+        assert http_client.get_http_client() is client
+        response = await http_client.get_http_client().get("https://example.test/ping")
+        await http_client.close_http_client()
+        return response.json()
+
+    assert asyncio.run(scenario()) == {"ok": True}
+    assert seen == [("GET", "https://example.test/ping")]
+
+def test_client_is_shared_until_replaced():
+    transport = httpx.MockTransport(lambda request: httpx.Response(204))
+
+    async def scenario():
+        first = await http_client.init_http_client(transport)
+        assert http_client.get_http_client() is first
+        assert http_client.get_http_client() is first # Reused, not rebuilt per call
+        second = await http_client.init_http_client(transport)
+        assert second is not first
+        assert first.is_closed
+        await http_client.close_http_client()
+        assert second.is_closed
+        assert http_client._client is None
+
+    asyncio.run(scenario())
+
+def test_created_lazily_outside_the_lifespan():
+    async def scenario():
+        client = http_client.get_http_client()
+        assert client is http_client.get_http_client()
+        await http_client.close_http_client()
+
+    asyncio.run(scenario())
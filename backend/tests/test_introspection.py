@@ -0,0 +1,77 @@
+"""
+POST /auth/introspect: RFC 7662 form requests, the JSON batch mode, and the
+"introspect"/"admin" scope gate on the caller.
+"""
+import pytest
+
+URL = "/api/v1/auth/introspect"
+
+
+def _access_token(login, user) -> str:
+    response = login(user["email"], user["password"])
+    assert response.status_code == 200, response.text
+    return response.json()["access_token"]
+
+@pytest.fixture
+def gateway_headers(login, create_user):
+    """ A service account holding only the introspect scope """
+    return {"Authorization": f"Bearer {_access_token(login, create_user(scopes=['introspect']))}"}
+
+
+def test_batch_mixes_valid_and_invalid_tokens(client, login, admin_headers, create_user, gateway_headers):
+    user = create_user(scopes=["read:profile"])
+    valid = _access_token(login, user)
+    deactivated_user = create_user()
+    revoked = _access_token(login, deactivated_user)
+    client.put(f"/api/v1/users/{deactivated_user['id']}", json={"is_active": False}, headers=admin_headers)
+
+    tokens = [valid, "not.a.jwt", revoked, valid[:-4] + "AAAA", valid]
+    response = client.post(URL, json={"tokens": tokens}, headers=gateway_headers)
+    assert response.status_code == 200, response.text
+    results = response.json()["results"]
+    assert [result["active"] for result in results] == [True, False, False, False, True] # In request order
+    assert results[0]["sub"] == str(user["id"])
+    assert results[0]["scope"] == "read:profile"
+    assert results[0]["exp"] > 0
+    assert results[1] == {"active": False} # Inactive results say nothing else
+    assert results[0] == results[4]
+
+def test_batch_validation(client, gateway_headers):
+    assert client.post(URL, json={"tokens": []}, headers=gateway_headers).status_code == 422
+    assert client.post(URL, json={"token": "x"}, headers=gateway_headers).status_code == 422
+    response = client.post(URL, content=b"token=x", headers={**gateway_headers, "Content-Type": "text/plain"})
+    assert response.status_code == 415
+
+def test_form_request_is_rfc7662(client, login, create_user, gateway_headers):
+    user = create_user()
+    token = _access_token(login, user)
+    response = client.post(URL, data={"token": token, "token_type_hint": "access_token"}, headers=gateway_headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("application/json")
+    body = response.json()
+    assert body["active"] is True
+    assert body["sub"] == str(user["id"])
+    assert body["token_type"] == "bearer"
+    assert isinstance(body["scope"], str) # Space-separated string, not a list
+
+    response = client.post(URL, data={"token": "garbage"}, headers=gateway_headers)
+    assert response.status_code == 200 # Invalid tokens are a normal answer, not an error
+    assert response.json() == {"active": False}
+
+    assert client.post(URL, data={"token_type_hint": "access_token"}, headers=gateway_headers).status_code == 400
+
+@pytest.mark.parametrize("scopes", [[], ["read:profile"]])
+def test_caller_without_scope_forbidden(client, login, create_user, scopes):
+    caller = create_user(scopes=scopes)
+    headers = {"Authorization": f"Bearer {_access_token(login, caller)}"}
+    assert client.post(URL, data={"token": "x"}, headers=headers).status_code == 403
+    assert client.post(URL, json={"tokens": ["x"]}, headers=headers).status_code == 403
+
+def test_admin_may_introspect(client, admin_headers):
+    response = client.post(URL, json={"tokens": ["x"]}, headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json() == {"results": [{"active": False}]}
+
+def test_unauthenticated_caller(client):
+    client.cookies.clear()
+    assert client.post(URL, data={"token": "x"}).status_code == 401
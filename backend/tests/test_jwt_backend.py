@@ -0,0 +1,132 @@
+"""
+HmacBackend must accept and reject exactly what python-jose does for HS* tokens.
+Run with: python -m pytest -q tests (from backend/)
+"""
+import base64
+import hashlib
+import hmac
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from jose import JWTError, jwt as jose_jwt
+
+from app.auth.jwt_backend import HmacBackend
+
+KEY = "test-secret"
+OTHER_KEY = "other-secret"
+
+
+def _segment(data) -> str:
+    raw = data if isinstance(data, bytes) else json.dumps(data).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def _claims(**overrides):
+    now = datetime.now(timezone.utc)
+    claims = {"sub": "user@example.com", "exp": now + timedelta(minutes=5), "iat": now, "scopes": ["me"]}
+    claims.update(overrides)
+    return claims
+
+def _signed(header, payload, key=KEY, algorithm="HS256") -> str:
+    """ A correctly signed token around an arbitrary header/payload segment, to test what follows the signature check. """
+    signing_input = f"{_segment(header)}.{_segment(payload)}"
+    digest = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}[algorithm]
+    signature = _segment(hmac.new(key.encode(), signing_input.encode(), digest).digest())
+    return f"{signing_input}.{signature}"
+
+@pytest.fixture
+def backend():
+    return HmacBackend()
+
+
+# --- Parity with python-jose on valid tokens ---
+
+@pytest.mark.parametrize("algorithm", ["HS256", "HS384", "HS512"])
+def test_decodes_jose_tokens(backend, algorithm):
+    token = jose_jwt.encode(_claims(), KEY, algorithm=algorithm)
+    assert backend.decode(token, KEY, [algorithm]) == jose_jwt.decode(token, KEY, algorithms=[algorithm])
+
+@pytest.mark.parametrize("algorithm", ["HS256", "HS384", "HS512"])
+def test_jose_decodes_our_tokens(backend, algorithm):
+    claims = _claims()
+    token = backend.encode(claims, KEY, algorithm, headers={"kid": "k1"})
+    assert jose_jwt.decode(token, KEY, algorithms=[algorithm]) == backend.decode(token, KEY, [algorithm])
+    assert jose_jwt.get_unverified_header(token) == {"alg": algorithm, "typ": "JWT", "kid": "k1"}
+
+def test_datetime_claims_encoded_like_jose(backend):
+    claims = _claims()
+    ours = jose_jwt.get_unverified_claims(backend.encode(claims, KEY, "HS256"))
+    theirs = jose_jwt.get_unverified_claims(jose_jwt.encode(claims, KEY, algorithm="HS256"))
+    assert ours == theirs
+
+
+# --- Rejections ---
+
+def test_rejects_tampered_signature(backend):
+    token = backend.encode(_claims(), KEY, "HS256")
+    signing_input, signature = token.rsplit(".", 1)
+    tampered = signing_input + "." + ("A" if signature[0] != "A" else "B") + signature[1:]
+    with pytest.raises(JWTError):
+        backend.decode(tampered, KEY, ["HS256"])
+
+def test_rejects_tampered_payload(backend):
+    token = backend.encode(_claims(), KEY, "HS256")
+    header, _, signature = token.split(".")
+    forged = f"{header}.{_segment(_claims(sub='admin@example.com', scopes=['admin']) | {'exp': 4102444800, 'iat': 0})}.{signature}"
+    with pytest.raises(JWTError):
+        backend.decode(forged, KEY, ["HS256"])
+
+def test_rejects_wrong_key(backend):
+    token = backend.encode(_claims(), OTHER_KEY, "HS256")
+    with pytest.raises(JWTError):
+        backend.decode(token, KEY, ["HS256"])
+
+def test_rejects_disallowed_algorithm(backend):
+    token = backend.encode(_claims(), KEY, "HS512")
+    with pytest.raises(JWTError):
+        backend.decode(token, KEY, ["HS256"])
+
+@pytest.mark.parametrize("alg", ["none", "None", None])
+def test_rejects_alg_none(backend, alg):
+    header = {"typ": "JWT"} if alg is None else {"alg": alg, "typ": "JWT"}
+    token = f"{_segment(header)}.{_segment({'sub': 'admin@example.com'})}."
+    with pytest.raises(JWTError):
+        backend.decode(token, KEY, ["HS256"])
+
+def test_rejects_expired(backend):
+    token = backend.encode(_claims(exp=datetime.now(timezone.utc) - timedelta(seconds=5)), KEY, "HS256")
+    with pytest.raises(JWTError):
+        backend.decode(token, KEY, ["HS256"])
+
+def test_rejects_not_yet_valid(backend):
+    token = backend.encode(_claims(nbf=datetime.now(timezone.utc) + timedelta(minutes=1)), KEY, "HS256")
+    with pytest.raises(JWTError):
+        backend.decode(token, KEY, ["HS256"])
+
+@pytest.mark.parametrize("claims", [{"exp": "never"}, {"nbf": "soon"}, {"aud": "elsewhere"}, {"sub": 42}])
+def test_rejects_invalid_registered_claims(backend, claims):
+    token = _signed({"alg": "HS256", "typ": "JWT"}, _claims(exp=4102444800, iat=0) | claims)
+    with pytest.raises(JWTError):
+        jose_jwt.decode(token, KEY, algorithms=["HS256"])
+    with pytest.raises(JWTError):
+        backend.decode(token, KEY, ["HS256"])
+
+@pytest.mark.parametrize("token", [
+    "",
+    "abc",
+    "abc.def",
+    "a.b.c.d",
+    "!!!.e30.sig",
+    f"{_segment(b'not json')}.e30.sig",
+    f"{_segment([1, 2])}.e30.sig",
+    f"{_segment({'alg': 'HS256'})}.é.sig",
+])
+def test_rejects_malformed_tokens(backend, token):
+    with pytest.raises(JWTError):
+        backend.decode(token, KEY, ["HS256"])
+
+@pytest.mark.parametrize("payload", [[1, 2], "string", 7, b"not json"])
+def test_rejects_non_object_payload(backend, payload):
+    token = _signed({"alg": "HS256", "typ": "JWT"}, payload)
+    with pytest.raises(JWTError):
+        backend.decode(token, KEY, ["HS256"])
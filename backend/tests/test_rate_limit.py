@@ -0,0 +1,181 @@
+"""
+Token buckets and the failed-login lockout (against MemoryRateLimitStore with a fake clock),
+and which X-Forwarded-For hop is taken as the client IP.
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app import rate_limit
+from app.config import settings
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", fake)
+    return fake
+
+@pytest.fixture
+def store(clock):
+    return rate_limit.MemoryRateLimitStore(max_keys=100)
+
+@pytest.fixture
+def enabled(monkeypatch, store):
+    """ Turns limiting on (conftest disables it for the API tests) with a fresh store. """
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(rate_limit, "_store", store)
+    return store
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def request(*forwarded_for: str, peer: str = "10.0.0.9") -> Request:
+    headers = [(b"x-forwarded-for", value.encode()) for value in forwarded_for]
+    return Request({"type": "http", "headers": headers, "client": (peer, 41000) if peer else None})
+
+
+def test_parse_rate():
+    assert rate_limit.parse_rate("30/minute") == (30.0, 0.5)
+    assert rate_limit.parse_rate("10/5") == (10.0, 2.0)
+    assert rate_limit.parse_rate("2/s") == (2.0, 2.0)
+    assert rate_limit.parse_rate("") is None
+    assert rate_limit.parse_rate("0/minute") is None
+
+
+# --- Token buckets ---
+
+def test_bucket_allows_capacity_then_refills(store, clock):
+    for _ in range(3):
+        assert run(store.take("k", 3, 1.0)) == 0
+    retry_after = run(store.take("k", 3, 1.0))
+    assert retry_after == pytest.approx(1.0)
+    clock.now += 1.0
+    assert run(store.take("k", 3, 1.0)) == 0
+    assert run(store.take("k", 3, 1.0)) > 0
+
+def test_bucket_never_exceeds_capacity(store, clock):
+    run(store.take("k", 2, 1.0))
+    clock.now += 3600
+    assert [run(store.take("k", 2, 1.0)) == 0 for _ in range(3)] == [True, True, False]
+
+def test_buckets_are_per_key(store):
+    assert run(store.take("a", 1, 0.1)) == 0
+    assert run(store.take("a", 1, 0.1)) > 0
+    assert run(store.take("b", 1, 0.1)) == 0
+
+def test_least_recently_used_keys_dropped(clock):
+    store = rate_limit.MemoryRateLimitStore(max_keys=2)
+    run(store.take("a", 1, 0.001))
+    run(store.take("b", 1, 0.001))
+    run(store.take("c", 1, 0.001)) # Evicts "a"
+    assert run(store.take("a", 1, 0.001)) == 0 # A fresh, full bucket
+    assert run(store.take("c", 1, 0.001)) > 0
+
+def test_hit_raises_429_with_retry_after(enabled):
+    run(rate_limit.hit("login:ip:1.2.3.4", "1/minute"))
+    with pytest.raises(HTTPException) as excinfo:
+        run(rate_limit.hit("login:ip:1.2.3.4", "1/minute"))
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.headers["Retry-After"] == "60"
+
+def test_hit_disabled(monkeypatch, store):
+    monkeypatch.setattr(rate_limit, "_store", store)
+    monkeypatch.setattr(settings, "rate_limit_enabled", False)
+    for _ in range(5):
+        run(rate_limit.hit("k", "1/minute"))
+
+
+# --- Failed-login lockout ---
+
+def test_lockout_starts_at_max_failures_and_expires(store, clock):
+    for _ in range(2):
+        run(store.add_failure("f", 3, 60))
+    assert run(store.lockout_remaining("f", 3, 60)) == 0
+    clock.now += 10
+    run(store.add_failure("f", 3, 60))
+    # Locked until the oldest of the last three failures leaves the window
+    assert run(store.lockout_remaining("f", 3, 60)) == pytest.approx(50)
+    clock.now += 50
+    assert run(store.lockout_remaining("f", 3, 60)) == 0
+
+def test_lockout_cleared(store):
+    for _ in range(3):
+        run(store.add_failure("f", 3, 60))
+    assert run(store.lockout_remaining("f", 3, 60)) > 0
+    run(store.clear_failures("f"))
+    assert run(store.lockout_remaining("f", 3, 60)) == 0
+
+def test_login_lockout(enabled, clock, monkeypatch):
+    monkeypatch.setattr(settings, "login_lockout_max_failures", 3)
+    monkeypatch.setattr(settings, "login_lockout_window_seconds", 900)
+    monkeypatch.setattr(settings, "rate_limit_login_per_email", "100/minute")
+    for _ in range(3):
+        run(rate_limit.check_login_allowed("Victim@Example.com"))
+        run(rate_limit.record_login_failure("victim@example.com "))
+    with pytest.raises(HTTPException) as excinfo: # Same account however the email is spelled
+        run(rate_limit.check_login_allowed("victim@example.com"))
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.headers["Retry-After"] == "900"
+    run(rate_limit.check_login_allowed("someone-else@example.com"))
+
+    clock.now += 900
+    run(rate_limit.check_login_allowed("victim@example.com"))
+
+def test_login_success_clears_failures(enabled, monkeypatch):
+    monkeypatch.setattr(settings, "login_lockout_max_failures", 2)
+    monkeypatch.setattr(settings, "rate_limit_login_per_email", "100/minute")
+    run(rate_limit.record_login_failure("user@example.com"))
+    run(rate_limit.record_login_success("user@example.com"))
+    run(rate_limit.record_login_failure("user@example.com"))
+    run(rate_limit.check_login_allowed("user@example.com"))
+
+def test_login_per_email_bucket(enabled, monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_login_per_email", "2/minute")
+    run(rate_limit.check_login_allowed("user@example.com"))
+    run(rate_limit.check_login_allowed("USER@example.com"))
+    with pytest.raises(HTTPException) as excinfo:
+        run(rate_limit.check_login_allowed("user@example.com"))
+    assert excinfo.value.status_code == 429
+
+
+# --- Client IP ---
+
+def test_forwarded_for_ignored_without_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_trusted_proxies", 0)
+    assert rate_limit.client_ip(request("6.6.6.6")) == "10.0.0.9"
+    assert rate_limit.client_ip(request()) == "10.0.0.9"
+    assert rate_limit.client_ip(request("6.6.6.6", peer=None)) == "unknown"
+
+def test_spoofed_leftmost_hop_ignored(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_trusted_proxies", 1)
+    # The client sent "6.6.6.6"; our proxy appended the address it actually saw
+    assert rate_limit.client_ip(request("6.6.6.6, 203.0.113.7")) == "203.0.113.7"
+    # Rotating the spoofed part doesn't change the bucket
+    assert rate_limit.client_ip(request("1.1.1.1, 203.0.113.7")) == "203.0.113.7"
+
+def test_trusted_hop_count(monkeypatch):
+    monkeypatch.setattr(settings, "rate_limit_trusted_proxies", 2)
+    assert rate_limit.client_ip(request("6.6.6.6, 203.0.113.7, 10.0.0.2")) == "203.0.113.7"
+    assert rate_limit.client_ip(request("6.6.6.6, 203.0.113.7", "10.0.0.2")) == "203.0.113.7" # Repeated headers
+    assert rate_limit.client_ip(request("203.0.113.7")) == "203.0.113.7" # Fewer hops than proxies
+    assert rate_limit.client_ip(request(" , ")) == "10.0.0.9"
+
+def test_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        rate_limit.RateLimitStore()
+
+    class Partial(rate_limit.RateLimitStore):
+        async def take(self, key, capacity, refill_per_second):
+            return 0.0
+    with pytest.raises(TypeError):
+        Partial()
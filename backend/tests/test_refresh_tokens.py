@@ -0,0 +1,103 @@
+"""
+Refresh-token rotation: every use issues a new token in the same family, a replayed
+(already rotated) token revokes the whole family, and logout revokes the session.
+"""
+from datetime import datetime, timedelta, timezone
+
+from app import crud_async, database, db_models
+from app.auth import crypto
+from app.config import settings
+
+
+def _refresh(client, refresh_token: str):
+    client.cookies.clear() # Present only the token under test
+    return client.post("/api/v1/auth/refresh", json={"refresh_token": refresh_token})
+
+def _session(login, user) -> str:
+    response = login(user["email"], user["password"])
+    assert response.status_code == 200, response.text
+    return response.cookies[settings.refresh_cookie_name]
+
+def test_rotation_issues_new_token(client, login, create_user):
+    user = create_user()
+    first = _session(login, user)
+    response = _refresh(client, first)
+    assert response.status_code == 200, response.text
+    assert response.json()["access_token"]
+    second = response.cookies[settings.refresh_cookie_name]
+    assert second != first
+    assert _refresh(client, second).status_code == 200
+
+def test_rotated_token_rejected_on_reuse(client, login, create_user):
+    user = create_user()
+    first = _session(login, user)
+    assert _refresh(client, first).status_code == 200
+    response = _refresh(client, first)
+    assert response.status_code == 401
+    assert settings.refresh_cookie_name in response.headers.get("set-cookie", "") # Cookie cleared
+
+def test_reuse_revokes_whole_family(client, login, create_user):
+    user = create_user()
+    first = _session(login, user)
+    other_session = _session(login, user)
+    second = _refresh(client, first).cookies[settings.refresh_cookie_name]
+    assert _refresh(client, first).status_code == 401 # Replay: assume the token was stolen
+    assert _refresh(client, second).status_code == 401 # ...so its successor dies too
+    assert _refresh(client, other_session).status_code == 200 # Other families are untouched
+
+def test_logout_revokes_token(client, login, create_user):
+    user = create_user()
+    token = _session(login, user)
+    client.cookies.clear()
+    response = client.post("/api/v1/auth/logout", json={"refresh_token": token})
+    assert response.status_code == 204
+    assert _refresh(client, token).status_code == 401
+
+def test_logout_with_cookie(client, login, create_user):
+    user = create_user()
+    token = _session(login, user) # Leaves the cookie in the client's jar
+    assert client.post("/api/v1/auth/logout").status_code == 204
+    assert _refresh(client, token).status_code == 401
+
+def test_unknown_and_missing_tokens_rejected(client):
+    assert _refresh(client, "not-a-token").status_code == 401
+    client.cookies.clear()
+    assert client.post("/api/v1/auth/refresh").status_code == 401
+
+def test_expired_token_rejected(client, login, create_user):
+    user = create_user()
+    token = _session(login, user)
+    with database.SessionLocal() as db:
+        stored = db.query(db_models.RefreshToken).filter_by(token_hash=crypto.hash_refresh_token(token)).one()
+        stored.expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        db.commit()
+    assert _refresh(client, token).status_code == 401
+
+
+# --- Pruning ---
+
+def test_prune_removes_only_expired_and_long_revoked(client, create_user):
+    user = create_user()
+    now = datetime.now(timezone.utc)
+    retention = timedelta(days=settings.refresh_token_revoked_retention_days)
+    rows = {
+        "live": dict(expires_at=now + timedelta(days=1)),
+        "expired": dict(expires_at=now - timedelta(seconds=1)),
+        "revoked_long_ago": dict(expires_at=now + timedelta(days=1), revoked_at=now - retention - timedelta(minutes=1)),
+        "revoked_recently": dict(expires_at=now + timedelta(days=1), revoked_at=now - retention + timedelta(minutes=1)),
+    }
+    with database.SessionLocal() as db:
+        for name, fields in rows.items():
+            db.add(db_models.RefreshToken(
+                user_id=user["id"], token_hash=crypto.hash_refresh_token(f"{name}-{user['id']}"), family_id=name, **fields
+            ))
+        db.commit()
+
+    async def prune():
+        async with database.AsyncSessionLocal() as db:
+            return await crud_async.prune_refresh_tokens(db)
+    assert client.portal.call(prune) >= 2 # Runs on the app's event loop, like a request would
+
+    with database.SessionLocal() as db:
+        remaining = {token.family_id for token in db.query(db_models.RefreshToken).filter_by(user_id=user["id"])}
+    assert remaining == {"live", "revoked_recently"}
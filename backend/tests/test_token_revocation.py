@@ -0,0 +1,41 @@
+"""
+Access tokens carry the user's token_version ("ver"); a password change or
+deactivation bumps it, so tokens issued before must stop validating in both modes.
+"""
+import pytest
+
+from app.config import settings
+
+
+@pytest.fixture(params=["database", "stateless"])
+def validation_mode(request, monkeypatch):
+    monkeypatch.setattr(settings, "token_validation_mode", request.param)
+    return request.param
+
+def _bearer(response) -> dict:
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.mark.parametrize("change", [{"password": "password2"}, {"is_active": False}])
+def test_version_bump_revokes_earlier_tokens(client, login, admin_headers, create_user, validation_mode, change):
+    user = create_user()
+    headers = _bearer(login(user["email"], user["password"]))
+    assert client.get("/api/v1/auth/me", headers=headers).status_code == 200 # Status now cached
+
+    response = client.put(f"/api/v1/users/{user['id']}", json=change, headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+    assert client.get("/api/v1/auth/me", headers=headers).status_code == 401
+
+def test_unrelated_update_keeps_tokens(client, login, admin_headers, create_user, validation_mode):
+    user = create_user()
+    headers = _bearer(login(user["email"], user["password"]))
+    response = client.put(f"/api/v1/users/{user['id']}", json={"name": "Renamed"}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert client.get("/api/v1/auth/me", headers=headers).status_code == 200
+
+def test_new_token_after_password_change(client, login, admin_headers, create_user, validation_mode):
+    user = create_user()
+    client.put(f"/api/v1/users/{user['id']}", json={"password": "password2"}, headers=admin_headers)
+    headers = _bearer(login(user["email"], "password2"))
+    assert client.get("/api/v1/auth/me", headers=headers).status_code == 200
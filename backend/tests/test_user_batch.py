@@ -0,0 +1,103 @@
+"""
+POST /users/batch: scope and is_active changes for many users selected by ids or filter,
+the counts it reports, and the guard against an admin locking themselves out.
+"""
+import uuid
+
+import pytest
+
+URL = "/api/v1/users/batch"
+
+
+@pytest.fixture
+def admin_id(client, admin_headers) -> int:
+    return client.get("/api/v1/auth/me", headers=admin_headers).json()["id"]
+
+def _user(client, admin_headers, user_id: int) -> dict:
+    return client.get(f"/api/v1/users/{user_id}", headers=admin_headers).json()
+
+
+def test_batch_by_ids(client, admin_headers, create_user):
+    first = create_user(scopes=["read:profile", "beta"])
+    second = create_user(scopes=["read:profile"])
+    response = client.post(URL, json={
+        "user_ids": [first["id"], second["id"]], "add_scopes": ["reports"], "remove_scopes": ["beta"], "is_active": False,
+    }, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == {
+        "matched": 2, "updated": 2, "granted": {"reports": 2}, "revoked": {"beta": 1}, "active_changed": 2,
+    }
+    assert _user(client, admin_headers, first["id"])["scopes"] == ["read:profile", "reports"]
+    assert _user(client, admin_headers, second["id"])["is_active"] is False
+
+def test_batch_reports_only_real_changes(client, admin_headers, create_user):
+    user = create_user(scopes=["reports"])
+    body = {"user_ids": [user["id"]], "add_scopes": ["reports"], "is_active": True} # Already so
+    assert client.post(URL, json=body, headers=admin_headers).json() == {
+        "matched": 1, "updated": 0, "granted": {"reports": 0}, "revoked": {}, "active_changed": 0,
+    }
+
+def test_batch_by_filter(client, admin_headers, create_user):
+    tag = uuid.uuid4().hex[:8]
+    users = [create_user(email=f"batch-{tag}-{i}@example.com") for i in range(3)]
+    other = create_user()
+    response = client.post(URL, json={"filter": {"email_prefix": f"batch-{tag}-"}, "add_scopes": ["beta"]}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["matched"] == 3
+    assert all("beta" in _user(client, admin_headers, user["id"])["scopes"] for user in users)
+    assert "beta" not in _user(client, admin_headers, other["id"])["scopes"]
+
+def test_unknown_ids_are_skipped(client, admin_headers, create_user):
+    user = create_user()
+    response = client.post(URL, json={"user_ids": [user["id"], 987654321], "add_scopes": ["beta"]}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["matched"] == 1
+    assert response.json()["granted"] == {"beta": 1}
+
+    response = client.post(URL, json={"user_ids": [987654321, 987654322], "is_active": False}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == {"matched": 0, "updated": 0, "granted": {}, "revoked": {}, "active_changed": 0}
+
+
+# --- Self-protection ---
+
+@pytest.mark.parametrize("change", [{"is_active": False}, {"remove_scopes": ["admin"]}])
+def test_admin_cannot_lock_themselves_out_by_id(client, admin_headers, admin_id, create_user, change):
+    user = create_user(scopes=["admin"])
+    response = client.post(URL, json={"user_ids": [user["id"], admin_id], **change}, headers=admin_headers)
+    assert response.status_code == 403
+    # Rejected as a whole: the other user wasn't changed either
+    other = _user(client, admin_headers, user["id"])
+    assert other["is_active"] is True and other["scopes"] == ["admin"]
+    me = _user(client, admin_headers, admin_id)
+    assert me["is_active"] is True and "admin" in me["scopes"]
+
+@pytest.mark.parametrize("change", [{"is_active": False}, {"remove_scopes": ["admin"]}])
+def test_admin_cannot_lock_themselves_out_by_filter(client, admin_headers, admin_id, change):
+    response = client.post(URL, json={"filter": {"scope": "admin"}, **change}, headers=admin_headers)
+    assert response.status_code == 403
+    assert client.get("/api/v1/auth/me", headers=admin_headers).status_code == 200
+
+def test_admin_may_change_themselves_otherwise(client, admin_headers, admin_id):
+    response = client.post(URL, json={"user_ids": [admin_id], "add_scopes": ["beta"], "is_active": True}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["granted"] == {"beta": 1}
+
+
+@pytest.mark.parametrize("body", [
+    {"add_scopes": ["beta"]}, # No selection
+    {"user_ids": [1], "filter": {"is_active": True}, "add_scopes": ["beta"]},
+    {"filter": {}, "is_active": False}, # Would select everyone
+    {"user_ids": [1]}, # Nothing to change
+    {"user_ids": [1], "add_scopes": ["beta"], "remove_scopes": ["beta"]},
+    {"user_ids": [1], "add_scopes": [""]},
+    {"user_ids": [], "add_scopes": ["beta"]},
+])
+def test_invalid_batch(client, admin_headers, body):
+    assert client.post(URL, json=body, headers=admin_headers).status_code == 422
+
+def test_requires_admin(client, login, create_user):
+    user = create_user()
+    token = login(user["email"], user["password"]).json()["access_token"]
+    response = client.post(URL, json={"user_ids": [user["id"]], "add_scopes": ["admin"]}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
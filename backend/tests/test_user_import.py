@@ -0,0 +1,154 @@
+"""
+POST /users/import: per-row results (created / exists / duplicate / invalid) for NDJSON
+and CSV uploads (plain or gzip-encoded), batching, and the retry when a concurrent signup takes an email.
+"""
+import gzip
+import json
+import uuid
+
+import pytest
+
+from app import crud, database, models
+from app.auth import crypto
+from app.config import settings
+
+URL = "/api/v1/users/import"
+
+
+def _email(label: str) -> str:
+    return f"import-{label}-{uuid.uuid4().hex[:8]}@example.com"
+
+def _post(client, headers, body: bytes, content_type: str, **extra_headers):
+    response = client.post(URL, content=body, headers={**headers, "Content-Type": content_type, **extra_headers})
+    assert response.status_code == 200, response.text
+    *results, summary = [json.loads(line) for line in response.text.splitlines()]
+    return results, summary["summary"]
+
+def _ndjson(*rows) -> bytes:
+    return b"".join((row if isinstance(row, bytes) else json.dumps(row).encode()) + b"\n" for row in rows)
+
+
+def test_ndjson_import(client, login, admin_headers, create_user, monkeypatch):
+    monkeypatch.setattr(settings, "user_import_batch_size", 2) # Several batches, results still in order
+    existing = create_user()
+    new, other = _email("new"), _email("other")
+    body = _ndjson(
+        {"email": new, "password": "password1", "name": "New", "scopes": ["read:profile"]},
+        {"email": existing["email"], "password": "password1"},
+        {"email": new, "password": "password2"},
+        b'{"email": "broken@example.com", "password": ',
+        {"email": "not-an-email", "password": "password1"},
+        {"email": _email("short"), "password": "short"},
+        b"",
+        [1, 2, 3],
+        {"email": other, "password": "password1", "is_active": False},
+    )
+    results, summary = _post(client, admin_headers, body, "application/x-ndjson")
+
+    assert [(r["row"], r["status"]) for r in results] == [
+        (1, "created"), (2, "exists"), (3, "duplicate"), (4, "invalid"), (5, "invalid"), (6, "invalid"), (7, "invalid"),
+        (8, "created"),
+    ] # The blank line isn't a record
+    assert summary == {"created": 2, "exists": 1, "duplicate": 1, "invalid": 4}
+    assert results[0]["email"] == new and results[0]["id"] > 0
+    assert results[3]["error"] == "Invalid JSON"
+    assert "error" in results[4] and "error" in results[5]
+
+    assert login(new, "password1").status_code == 200
+    assert login(other, "password1").status_code == 400 # Imported inactive
+    user = client.get(f"/api/v1/users/{results[0]['id']}", headers=admin_headers).json()
+    assert user["name"] == "New" and user["scopes"] == ["read:profile"]
+
+def test_csv_import(client, login, admin_headers, create_user):
+    existing = create_user()
+    first, second = _email("csv1"), _email("csv2")
+    body = "\r\n".join([
+        "email,name,password,scopes",
+        f'{first},"Last, First",password1,read:profile beta',
+        f"{existing['email']},,password1,",
+        f"{first},Again,password1,",
+        f"{second},Two,password1", # Missing a column
+        f'{second},"Multi\nline",password1,',
+        "",
+    ]).encode()
+    results, summary = _post(client, admin_headers, body, "text/csv")
+
+    assert [r["status"] for r in results] == ["created", "exists", "duplicate", "invalid", "created"]
+    assert summary == {"created": 2, "exists": 1, "duplicate": 1, "invalid": 1}
+    assert results[3]["error"] == "Expected 4 columns, got 3"
+    user = client.get(f"/api/v1/users/{results[0]['id']}", headers=admin_headers).json()
+    assert user["name"] == "Last, First"
+    assert user["scopes"] == ["read:profile", "beta"]
+    assert login(second, "password1").status_code == 200
+
+def test_gzipped_csv_import(client, login, admin_headers, create_user):
+    existing = create_user()
+    first, second = _email("gz1"), _email("gz2")
+    csv_body = "\n".join([
+        "email,password,is_active",
+        f"{first},password1,true",
+        f"{existing['email']},password1,true",
+        f"{first},password1,false",
+        f"{second},password1,maybe", # Not a boolean
+        f"{second},password1,",
+    ]).encode()
+    # Two members, split mid-row: decompressed as one stream
+    body = gzip.compress(csv_body[:40]) + gzip.compress(csv_body[40:])
+    results, summary = _post(client, admin_headers, body, "text/csv", **{"Content-Encoding": "gzip"})
+
+    assert [r["status"] for r in results] == ["created", "exists", "duplicate", "invalid", "created"]
+    assert summary == {"created": 2, "exists": 1, "duplicate": 1, "invalid": 1}
+    assert login(first, "password1").status_code == 200
+    assert login(second, "password1").status_code == 200
+
+@pytest.mark.parametrize("body", [b"not gzip at all", gzip.compress(b"email,password\nx@example.com,password1\n")[:-6]])
+def test_bad_gzip_body(client, admin_headers, body):
+    headers = {**admin_headers, "Content-Type": "text/csv", "Content-Encoding": "gzip"}
+    assert client.post(URL, content=body, headers=headers).status_code == 400
+
+def test_unsupported_content_encoding(client, admin_headers):
+    headers = {**admin_headers, "Content-Type": "text/csv", "Content-Encoding": "br"}
+    assert client.post(URL, content=b"email\n", headers=headers).status_code == 415
+
+def test_import_with_existing_password_hash(client, login, admin_headers):
+    email = _email("hash")
+    body = _ndjson(
+        {"email": email, "password_hash": crypto.get_password_hash("migrated-pw")},
+        {"email": _email("badhash"), "password_hash": "md5$abc"},
+        {"email": _email("both"), "password": "password1", "password_hash": crypto.get_password_hash("x" * 8)},
+    )
+    results, _ = _post(client, admin_headers, body, "application/x-ndjson")
+    assert [r["status"] for r in results] == ["created", "invalid", "invalid"]
+    assert login(email, "migrated-pw").status_code == 200
+
+def test_concurrent_signup_retried(client, admin_headers, monkeypatch):
+    taken, free = _email("race"), _email("free")
+    hash_passwords = crypto.hash_passwords_async
+
+    async def hash_then_race(passwords):
+        # Another request registers `taken` between the existence check and the insert
+        with database.SessionLocal() as db:
+            if crud.get_user_by_email(db, taken) is None:
+                crud.create_user(db, models.UserCreateInternal(email=taken, password="password1"))
+        return await hash_passwords(passwords)
+    monkeypatch.setattr(crypto, "hash_passwords_async", hash_then_race)
+
+    body = _ndjson({"email": taken, "password": "password1"}, {"email": free, "password": "password1"})
+    results, summary = _post(client, admin_headers, body, "application/x-ndjson")
+    assert [r["status"] for r in results] == ["exists", "created"]
+    assert summary["created"] == 1 and summary["exists"] == 1
+
+@pytest.mark.parametrize("body", [b"name,password\nx,password1\n", b"email,age\nx@example.com,3\n", b""])
+def test_bad_csv_header(client, admin_headers, body):
+    response = client.post(URL, content=body, headers={**admin_headers, "Content-Type": "text/csv"})
+    assert response.status_code == 400
+
+def test_unsupported_content_type(client, admin_headers):
+    response = client.post(URL, json=[{"email": "x@example.com"}], headers=admin_headers)
+    assert response.status_code == 415
+
+def test_requires_admin(client, login, create_user):
+    user = create_user()
+    token = login(user["email"], user["password"]).json()["access_token"]
+    response = client.post(URL, content=b"", headers={"Authorization": f"Bearer {token}", "Content-Type": "text/csv"})
+    assert response.status_code == 403